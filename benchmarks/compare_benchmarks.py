@@ -0,0 +1,44 @@
+"""Compare two result files of run_benchmarks.py
+
+Example:
+  python benchmarks/compare_benchmarks.py before.json after.json
+"""
+import argparse
+import json
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)["results"]
+    return {
+        (res["name"], res["n_icus"], res["n_days"], res["inputs_per_day"]): res
+        for res in results
+    }
+
+
+def main(args):
+    before = load_results(args.before)
+    after = load_results(args.after)
+    print(
+        "{:<60} {:>5} {:>5} {:>10} {:>10} {:>8}".format(
+            "benchmark", "ICUs", "days", "before", "after", "ratio"
+        )
+    )
+    for key in sorted(set(before) & set(after)):
+        name, n_icus, n_days, _ = key
+        if "min" not in before[key] or "min" not in after[key]:
+            continue
+        t_before, t_after = before[key]["min"], after[key]["min"]
+        print(
+            "{:<60} {:>5} {:>5} {:>9.4f}s {:>9.4f}s {:>7.2f}x".format(
+                name, n_icus, n_days, t_before, t_after, t_before / t_after
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    main(args)
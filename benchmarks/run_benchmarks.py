@@ -0,0 +1,213 @@
+"""Time preprocessing, data combination and plots on synthetic data
+
+Results are written as JSON, to be compared between versions with
+compare_benchmarks.py.
+
+Example:
+  python benchmarks/run_benchmarks.py --sizes 10x30 100x60 --output a.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from predicu.data import combine_bedcounts_public, format_public
+from predicu.preprocessing import (
+    _fix_mulhouse_chir,
+    _format_bedcounts,
+    aggregate_multiple_inputs,
+    enforce_daily_values_for_all_icus,
+    fill_in_missing_days,
+    preprocess_bedcounts,
+    spread_cum_jumps,
+)
+from predicu.synthetic import generate_bedcounts, generate_public
+
+
+def timeit(timings, name, func, repeat):
+    """Time `func` and store the times (or the error) in `timings[name]`"""
+    times = []
+    res = None
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            res = func()
+            times.append(time.perf_counter() - start)
+    except Exception as e:
+        logging.warning("%s failed: %r" % (name, e))
+        times = repr(e)
+    timings[name] = times
+    return res
+
+
+def benchmark_preprocessing(raw, repeat):
+    """Time each stage of preprocess_bedcounts and the whole function"""
+    stages = [
+        ("format", _format_bedcounts),
+        ("fix_mulhouse_chir", _fix_mulhouse_chir),
+        ("aggregate_multiple_inputs", aggregate_multiple_inputs),
+        ("fill_in_missing_days", fill_in_missing_days),
+        (
+            "enforce_daily_values_for_all_icus",
+            enforce_daily_values_for_all_icus,
+        ),
+    ]
+    timings = {}
+    d = raw
+    for name, func in stages:
+        d = timeit(timings, name, lambda: func(d), repeat)
+        if name == "fix_mulhouse_chir":
+            icu_to_first_input_date = dict(
+                d.groupby("icu_name")[["date"]].min().itertuples(name=None)
+            )
+    timeit(
+        timings,
+        "spread_cum_jumps",
+        lambda: spread_cum_jumps(d, icu_to_first_input_date),
+        repeat,
+    )
+    timeit(
+        timings,
+        "total",
+        lambda: preprocess_bedcounts(raw, spread_cum_jump_correction=True),
+        repeat,
+    )
+    return timings
+
+
+def benchmark_plots(raw, public, repeat):
+    import matplotlib
+
+    matplotlib.use("agg")
+    from predicu.plot import PLOTS, generate_plots
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name in sorted(PLOTS):
+            cached_data = {"bedcounts": raw, "public": public}
+            timeit(
+                timings,
+                name,
+                lambda: generate_plots(
+                    plots=[name],
+                    cached_data=cached_data,
+                    output_dir=output_dir,
+                    matplotlib_style="default",
+                ),
+                repeat,
+            )
+    return timings
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    from predicu.plot import DEPARTMENTS_GRAND_EST
+
+    results = []
+    for size in args.sizes:
+        n_icus, n_days = [int(n) for n in size.split("x")]
+        logging.info("benchmarking %d ICUs, %d days" % (n_icus, n_days))
+        departments = DEPARTMENTS_GRAND_EST if args.plots else None
+        raw = generate_bedcounts(
+            n_icus=n_icus,
+            n_days=n_days,
+            inputs_per_day=args.inputs_per_day,
+            departments=departments,
+            seed=args.seed,
+        )
+        public = format_public(
+            generate_public(
+                n_days=n_days, departments=departments, seed=args.seed
+            )
+        )
+        timings = {
+            f"preprocess_bedcounts.{stage}": times
+            for stage, times in benchmark_preprocessing(
+                raw, args.repeat
+            ).items()
+        }
+        bedcounts = preprocess_bedcounts(raw)
+        timeit(
+            timings,
+            "combine_bedcounts_public",
+            lambda: combine_bedcounts_public(public, bedcounts),
+            args.repeat,
+        )
+        if args.plots:
+            for name, times in benchmark_plots(
+                raw, public, args.repeat
+            ).items():
+                timings[f"generate_plots.{name}"] = times
+        for name, times in timings.items():
+            res = {
+                "name": name,
+                "n_icus": n_icus,
+                "n_days": n_days,
+                "inputs_per_day": args.inputs_per_day,
+                "n_inputs": len(raw),
+            }
+            if isinstance(times, str):
+                res["error"] = times
+            else:
+                res.update(
+                    times=times, min=min(times), median=np.median(times)
+                )
+            results.append(res)
+
+    output = {
+        "metadata": {
+            "date": datetime.datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    for res in results:
+        print(
+            "{name:<60} {n_icus:>5} ICUs {n_days:>4} days  {time}".format(
+                time=res.get("error") or "%.4fs" % res["min"], **res
+            )
+        )
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=["10x30", "100x60", "300x120"],
+        help="sizes of the synthetic data, as <number of ICUs>x<days>",
+    )
+    parser.add_argument("--inputs-per-day", type=float, default=3.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--plots",
+        action="store_true",
+        help="also time generate_plots (Grand-Est ICUs only)",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+    main(args)
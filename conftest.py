@@ -19,3 +19,10 @@ def pytest_collection_modifyitems(config, items):
     for item in items:
         if "slow" in item.keywords:
             item.add_marker(skip_slow)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Cached data and HTTP responses go to a temporary directory"""
+    monkeypatch.setenv("PREDICU_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
@@ -1,12 +1,23 @@
 import datetime
+import json
 import logging
 import os
+import pickle
 
 import click
 
-from predicu.data import load_bedcounts
-from predicu.plot import generate_plots
-from predicu.preprocessing import preprocess_bedcounts
+from predicu.cache import CACHE_DIR_ENV, cached_preprocess_data
+from predicu.data import (
+    RAW_BEDCOUNTS_COLUMNS,
+    get_region_departments,
+    load_bedcounts,
+    load_data,
+)
+from predicu.preprocessing import (
+    preprocess_bedcounts,
+    preprocess_bedcounts_incremental,
+)
+from predicu.profiling import format_report
 
 
 @click.group()
@@ -25,17 +36,111 @@ def cli():
     help="max date of the exported data (e.g. 2020-04-05)",
     type=str,
 )
+@click.option(
+    "--incremental-state",
+    default=None,
+    help="path of the preprocessing state, only the inputs more recent than "
+    "the state are preprocessed and the state is updated",
+    type=str,
+)
+@click.option(
+    "--n-jobs",
+    default=1,
+    help="number of processes used for preprocessing (-1 for all), not "
+    "supported with --incremental-state",
+    type=int,
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    envvar=CACHE_DIR_ENV,
+    help="directory where preprocessed data is cached (no cache by default)",
+    type=str,
+)
+@click.option(
+    "--store-dir",
+    default=None,
+    envvar="PREDICU_STORE_DIR",
+    help="directory of a columnar store of the raw data, shared between "
+    "runs (requires pyarrow)",
+    type=str,
+)
+@click.option(
+    "--raw-store",
+    default=None,
+    help="path of a local copy of the raw ICUBAM data, only the inputs "
+    "created since the last run are downloaded",
+    type=str,
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="print the time, rows and peak memory of each preprocessing stage",
+)
+@click.option(
+    "--profile-output",
+    default=None,
+    help="path of a JSON file where the preprocessing stages are reported",
+    type=str,
+)
+@click.option(
+    "--restrict-to-region",
+    default=None,
+    help="only export the ICUs of a region, given by its name (e.g. "
+    "Grand-Est) or INSEE code",
+    type=str,
+)
 def export_data_cli(
-    output_dir, api_key, spread_cum_jump_correction, icubam_host, max_date
+    output_dir,
+    api_key,
+    spread_cum_jump_correction,
+    icubam_host,
+    max_date,
+    incremental_state,
+    n_jobs,
+    cache_dir,
+    store_dir,
+    raw_store,
+    profile,
+    profile_output,
+    restrict_to_region,
 ):
     export_data(
-        output_dir, api_key, spread_cum_jump_correction, icubam_host, max_date
+        output_dir,
+        api_key,
+        spread_cum_jump_correction,
+        icubam_host,
+        max_date,
+        incremental_state,
+        n_jobs,
+        cache_dir,
+        store_dir,
+        raw_store,
+        profile,
+        profile_output,
+        restrict_to_region,
     )
 
 
 def export_data(
-    output_dir, api_key, spread_cum_jump_correction, icubam_host, max_date
+    output_dir,
+    api_key,
+    spread_cum_jump_correction,
+    icubam_host,
+    max_date,
+    incremental_state=None,
+    n_jobs=1,
+    cache_dir=None,
+    store_dir=None,
+    raw_store=None,
+    profile=False,
+    profile_output=None,
+    restrict_to_region=None,
 ):
+    if incremental_state is not None and n_jobs != 1:
+        raise ValueError("n_jobs is not supported with incremental_state")
+    report = []
+    hook = report.append if profile or profile_output is not None else None
     if not os.path.isdir(output_dir):
         logging.info("creating directory %s" % output_dir)
         os.makedirs(output_dir)
@@ -45,9 +150,61 @@ def export_data(
     datetimestr = datetime.datetime.now().strftime("%Y-%m-%d_%Hh%M")
     filename = "predicu_data_preprocessed_{}.csv".format(datetimestr)
     path = os.path.join(output_dir, filename)
-    d = load_bedcounts(api_key=api_key, icubam_host=icubam_host)
-    d = preprocess_bedcounts(d, max_date=max_date)
+    if store_dir is None:
+        d = load_bedcounts(
+            api_key=api_key, icubam_host=icubam_host, store_path=raw_store
+        )
+    else:
+        departments = None
+        if restrict_to_region is not None:
+            departments = get_region_departments(restrict_to_region)
+        d = load_data(
+            "bedcounts",
+            columns=RAW_BEDCOUNTS_COLUMNS,
+            departments=departments,
+            store_dir=store_dir,
+            api_key=api_key,
+            icubam_host=icubam_host,
+            store_path=raw_store,
+        )
+    if cache_dir is not None and incremental_state is None:
+        d = cached_preprocess_data(
+            "bedcounts",
+            d,
+            cache_dir=cache_dir,
+            max_date=max_date,
+            restrict_to_region=restrict_to_region,
+            n_jobs=n_jobs,
+            hook=hook,
+        )
+    elif incremental_state is None:
+        d = preprocess_bedcounts(
+            d,
+            max_date=max_date,
+            restrict_to_region=restrict_to_region,
+            n_jobs=n_jobs,
+            hook=hook,
+        )
+    else:
+        state = None
+        if os.path.isfile(incremental_state):
+            with open(incremental_state, "rb") as f:
+                state = pickle.load(f)
+        d, state = preprocess_bedcounts_incremental(
+            d,
+            state,
+            max_date=max_date,
+            restrict_to_region=restrict_to_region,
+            hook=hook,
+        )
+        with open(incremental_state, "wb") as f:
+            pickle.dump(state, f)
     d.to_csv(path)
+    if profile:
+        click.echo(format_report(report))
+    if profile_output is not None:
+        with open(profile_output, "w") as f:
+            json.dump(report, f, indent=2)
     logging.info("export DONE.")
 
 
@@ -77,14 +234,41 @@ def export_data(
 @click.option(
     "--restrict-to-region",
     default=None,
-    help="Whether to restrict the data a region. Valid values are: Grand-Est.",
+    help="only plot the data of a region, given by its name (e.g. "
+    "Grand-Est) or INSEE code",
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    envvar=CACHE_DIR_ENV,
+    help="directory where preprocessed data is cached (no cache by default)",
+    type=str,
+)
+@click.option(
+    "--store-dir",
+    default=None,
+    envvar="PREDICU_STORE_DIR",
+    help="directory of a columnar store of the raw data, shared between "
+    "runs (requires pyarrow)",
+    type=str,
+)
+@click.option(
+    "--jobs",
+    "-j",
+    "n_jobs",
+    default=1,
+    help="number of processes rendering the plots (-1 for all)",
+    type=int,
 )
 @click.argument(
     "plots", nargs=-1,
 )
 def plot_cli(**kwargs):
+    # the plotting libraries are only imported by this command
     import matplotlib
 
+    from predicu.plot import generate_plots
+
     matplotlib.use("Agg")
     if not kwargs["plots"]:
         kwargs["plots"] = None
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from predicu.cube import BedcountCube
+from predicu.preprocessing import PREPROCESSORS, preprocess_data
+
+# increment when the preprocessing output changes, to invalidate the cache
+CACHE_VERSION = 3
+CACHE_DIR_ENV = "PREDICU_CACHE_DIR"
+CACHE_MAX_SIZE = 2 * 1024 ** 3
+CACHE_MAX_AGE = 7 * 24 * 3600
+
+# arguments which do not change the preprocessing output
+IGNORED_KWARGS = {"n_jobs", "as_cube", "hook"}
+
+
+def get_cache_dir(cache_dir: Optional[str] = None) -> Path:
+    """Cache directory: `cache_dir`, $PREDICU_CACHE_DIR or ~/.cache/predicu"""
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            CACHE_DIR_ENV, os.path.join("~", ".cache", "predicu")
+        )
+    return Path(cache_dir).expanduser()
+
+
+def hash_data(data: pd.DataFrame, **kwargs) -> str:
+    """Hash of the content of a DataFrame and of keyword arguments"""
+    h = hashlib.sha256()
+    h.update(str(CACHE_VERSION).encode())
+    h.update(json.dumps(kwargs, sort_keys=True, default=str).encode())
+    h.update(json.dumps([str(col) for col in data.columns]).encode())
+    h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def cached_preprocess_data(
+    data_source: str,
+    data: pd.DataFrame,
+    cache_dir: Optional[str] = None,
+    max_size: Optional[int] = CACHE_MAX_SIZE,
+    max_age: Optional[float] = CACHE_MAX_AGE,
+    **kwargs,
+):
+    """preprocess_data with results cached on disk
+
+  Results are stored in `cache_dir` (see `get_cache_dir`), keyed by a hash
+  of the raw data and of the preprocessing arguments, as Feather files when
+  pyarrow is installed and as pickle files otherwise. Data of sources
+  without preprocessing (see PREPROCESSORS) is returned as is, uncached.
+
+  Args:
+    max_size : maximum size of the cache in bytes, least recently used
+      results are evicted first
+    max_age : results not used for `max_age` seconds are evicted
+  """
+    if data_source not in PREPROCESSORS:
+        return data
+    as_cube = kwargs.pop("as_cube", False)
+    key_kwargs = {
+        key: value
+        for key, value in kwargs.items()
+        if key not in IGNORED_KWARGS
+    }
+    key = hash_data(data, data_source=data_source, **key_kwargs)
+    cache_dir = get_cache_dir(cache_dir) / "preprocessed"
+    d = _read_cached(cache_dir, key)
+    if d is None:
+        d = preprocess_data(data_source, data, **kwargs)
+        _write_cached(cache_dir, key, d)
+        evict(cache_dir, max_size=max_size, max_age=max_age)
+    else:
+        logging.info("using cached preprocessed %s data" % data_source)
+    if as_cube:
+        return BedcountCube.from_frame(d)
+    return d
+
+
+def evict(
+    cache_dir: Path,
+    max_size: Optional[int] = None,
+    max_age: Optional[float] = None,
+):
+    """Remove the least recently used files of `cache_dir`
+
+  Files not used for `max_age` seconds are removed, then the least recently
+  used files are removed until the size of the directory is at most
+  `max_size` bytes. Temporary files of writes in progress are kept.
+  """
+    files = sorted(
+        (f.stat().st_mtime, f.stat().st_size, f)
+        for f in Path(cache_dir).iterdir()
+        if f.is_file() and f.suffix != ".tmp"
+    )
+    total_size = sum(size for _, size, _ in files)
+    now = time.time()
+    for mtime, size, path in files:
+        too_old = max_age is not None and now - mtime > max_age
+        too_big = max_size is not None and total_size > max_size
+        if not (too_old or too_big):
+            break
+        logging.info("evicting %s from the cache" % path)
+        path.unlink()
+        total_size -= size
+
+
+def _feather_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _read_cached(cache_dir, key):
+    for ext in ["feather", "pickle"]:
+        path = cache_dir / f"{key}.{ext}"
+        if not path.is_file():
+            continue
+        # mark as recently used
+        os.utime(path)
+        if ext == "feather":
+            d = pd.read_feather(path).set_index("index")
+            d.index.name = None
+        else:
+            with open(path, "rb") as f:
+                d = pickle.load(f)
+        return d
+    return None
+
+
+def _write_cached(cache_dir, key, d):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    ext = "feather" if _feather_available() else "pickle"
+    path = cache_dir / f"{key}.{ext}"
+    # not shared with other processes writing the same key
+    tmp_path = cache_dir / f"{key}.{ext}.{os.getpid()}.tmp"
+    if ext == "feather":
+        d.reset_index().to_feather(tmp_path)
+    else:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(d, f)
+    # concurrent processes never read partially written files
+    os.replace(tmp_path, path)
@@ -0,0 +1,160 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from predicu.data import BEDCOUNT_COLUMNS
+
+
+class BedcountCube:
+    """Preprocessed bedcounts as a dense (date, icu, column) array
+
+  ICUs are sorted by region, department and name so that the ICUs of a
+  region or of a department are contiguous: selecting them returns views of
+  the values, and reductions to departments or regions are plain NumPy sums
+  over contiguous segments.
+
+  Attributes:
+    values : array of shape (n_dates, n_icus, n_columns)
+    dates : datetime64[D] array of the n_dates dates
+    icu_names, departments, regions : arrays of the n_icus ICU attributes
+    columns : names of the n_columns columns
+  """
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        dates: np.ndarray,
+        icu_names: np.ndarray,
+        departments: np.ndarray,
+        regions: np.ndarray,
+        columns: Optional[List[str]] = None,
+    ):
+        if columns is None:
+            columns = list(BEDCOUNT_COLUMNS)
+        expected_shape = (len(dates), len(icu_names), len(columns))
+        if values.shape != expected_shape:
+            raise ValueError(
+                f"values of shape {values.shape}, expected {expected_shape}"
+            )
+        self.values = values
+        self.dates = dates
+        self.icu_names = icu_names
+        self.departments = departments
+        self.regions = regions
+        self.columns = columns
+
+    @classmethod
+    def from_frame(
+        cls, d: pd.DataFrame, columns: Optional[List[str]] = None
+    ) -> "BedcountCube":
+        """Build a cube from preprocessed bedcounts
+
+    `d` must contain one row per date and per ICU, which is the case of the
+    output of `preprocess_bedcounts`.
+    """
+        if columns is None:
+            columns = list(BEDCOUNT_COLUMNS)
+        icus = (
+            d[["icu_name", "department", "region"]]
+            .drop_duplicates(subset=["icu_name"])
+            .sort_values(by=["region", "department", "icu_name"])
+        )
+        dates = np.unique(pd.to_datetime(d.date).values.astype("M8[D]"))
+        date_idx = np.searchsorted(
+            dates, pd.to_datetime(d.date).values.astype("M8[D]")
+        )
+        icu_idx = d.icu_name.map(
+            pd.Series(np.arange(len(icus)), index=icus.icu_name.values)
+        ).values
+        if len(d) != len(dates) * len(icus):
+            raise ValueError("expected one row per date and per ICU")
+        values = np.zeros(
+            (len(dates), len(icus), len(columns)),
+            dtype=np.result_type(*d[columns].dtypes),
+        )
+        values[date_idx, icu_idx] = d[columns].values
+        return cls(
+            values,
+            dates,
+            # plain arrays, whatever the dtypes of the columns
+            np.asarray(icus.icu_name),
+            np.asarray(icus.department),
+            np.asarray(icus.region),
+            columns,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long DataFrame with one row per date and per ICU"""
+        n_dates, n_icus, _ = self.values.shape
+        d = pd.DataFrame(
+            {
+                "date": np.repeat(self.dates, n_icus),
+                "icu_name": np.tile(self.icu_names, n_dates),
+                "department": np.tile(self.departments, n_dates),
+                "region": np.tile(self.regions, n_dates),
+            }
+        )
+        values = self.values.reshape(n_dates * n_icus, len(self.columns))
+        for i, col in enumerate(self.columns):
+            d[col] = values[:, i]
+        return d
+
+    def column(self, col: str) -> np.ndarray:
+        """(n_dates, n_icus) view of the values of one column"""
+        return self.values[:, :, self.columns.index(col)]
+
+    def select_department(self, department: str) -> "BedcountCube":
+        return self._select(self.departments == department)
+
+    def select_region(self, region) -> "BedcountCube":
+        return self._select(self.regions == region)
+
+    def sum_by_department(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Sum over the ICUs of each department
+
+    Returns:
+      the departments and an array of shape (n_dates, n_departments,
+      n_columns)
+    """
+        return self._sum_by(self.departments)
+
+    def sum_by_region(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Sum over the ICUs of each region
+
+    Returns:
+      the regions and an array of shape (n_dates, n_regions, n_columns)
+    """
+        return self._sum_by(self.regions)
+
+    def _select(self, mask):
+        idx = np.flatnonzero(mask)
+        if len(idx) > 0 and idx[-1] - idx[0] + 1 == len(idx):
+            # contiguous ICUs, basic slicing returns views
+            idx = slice(idx[0], idx[-1] + 1)
+        return BedcountCube(
+            self.values[:, idx],
+            self.dates,
+            self.icu_names[idx],
+            self.departments[idx],
+            self.regions[idx],
+            self.columns,
+        )
+
+    def _sum_by(self, labels):
+        if len(labels) == 0:
+            return labels, self.values[:, :0]
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        sums = np.add.reduceat(self.values, starts, axis=1)
+        keys = labels[starts]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        if len(unique_keys) < len(keys):
+            # some labels are not contiguous (e.g. a department with ICUs in
+            # several regions)
+            res = np.zeros(
+                (sums.shape[0], len(unique_keys), sums.shape[2]),
+                dtype=sums.dtype,
+            )
+            np.add.at(res, (slice(None), inverse), sums)
+            return unique_keys, res
+        return keys, sums
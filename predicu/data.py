@@ -1,12 +1,21 @@
+import functools
+import json
 import logging
+import os
 import pickle
-import urllib.request
+import time
+import urllib.parse
 from pathlib import Path
-from typing import Callable, Dict
+from typing import Callable, Dict, List, Optional
 
+import numpy as np
 import pandas as pd
+import requests
 from lxml import html
 
+from predicu.download import open_url, read_csv_url, read_text_url
+from predicu.store import read_store, store_age, write_store
+
 BASE_PATH = Path(__file__).resolve().parent
 
 DATA_PATHS = {
@@ -19,34 +28,177 @@ for key, path in DATA_PATHS.items():
     DATA_PATHS[key] = str(Path(BASE_PATH) / path)
 
 
+# names of the departments data files fixed when they are read
+DEPARTMENT_NAME_FIXES = {"Côtes-d'armor": "Côtes-d'Armor"}
+# departments of the ICUs whose department is wrong in the ICUBAM data,
+# fixed by the preprocessing
+ICU_DEPARTMENT_FIXES = {"St-Dizier": "Haute-Marne"}
+# current names of the regions which have their provisional 2016 names in
+# the departments data file, by INSEE code
+REGION_NAMES = {
+    32: "Hauts-de-France",
+    44: "Grand-Est",
+    75: "Nouvelle-Aquitaine",
+    76: "Occitanie",
+}
+
+# reference tables built on first access, see __getattr__
+REFERENCE_TABLES = {
+    "CODE_TO_DEPARTMENT": lambda: dict(
+        zip(get_department_table().index, get_department_table().department)
+    ),
+    "DEPARTMENT_TO_CODE": lambda: dict(
+        zip(get_department_table().department, get_department_table().index)
+    ),
+    "DEPARTMENT_POPULATION": lambda: dict(_department_population()),
+    "DEPARTMENTS": lambda: frozenset(get_department_table().department),
+}
+
+
+def __getattr__(name):
+    """Build the reference tables once, when they are first used
+
+  Importing predicu.data does not read the departments data files.
+  """
+    if name in REFERENCE_TABLES:
+        value = REFERENCE_TABLES[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def load_department_population():
-    return dict(
-        pd.read_csv(DATA_PATHS["department_population"]).itertuples(
-            name=None, index=False
-        )
-    )
+    return dict(_department_population())
 
 
 def load_france_departments():
+    return _france_departments().copy()
+
+
+def load_department_typo_fixes() -> Dict[str, str]:
+    """Wrong department names in ICUBAM data and their fixes"""
+    return dict(_department_typo_fixes())
+
+
+@functools.lru_cache(maxsize=None)
+def get_department_table() -> pd.DataFrame:
+    """Departments indexed by code, sorted by code
+
+  Columns are department, region_code, region and population. Arrays of
+  values per department code are columns of this table, and codes are
+  turned into positions in these arrays with `index.get_indexer`. The table
+  is shared, it must not be modified.
+  """
+    d = _france_departments()
+    population = dict(_department_population())
+    table = pd.DataFrame(
+        {
+            "department": d.departmentName.values,
+            "region_code": d.regionCode.values,
+            "region": d.regionName.values,
+            "population": [
+                population.get(name, np.nan) for name in d.departmentName
+            ],
+        },
+        index=pd.Index(d.departmentCode.values, name="department_code"),
+    )
+    return table.sort_index()
+
+
+def get_region_departments(region) -> List[str]:
+    """Names of the departments of `region`
+
+  Args:
+    region : name of the region (e.g. "Grand-Est") or its INSEE code
+  """
+    table = get_department_table()
+    region_code = {name: code for code, name in REGION_NAMES.items()}.get(
+        region
+    )
+    if region_code is None and (table.region == region).any():
+        region_code = table.region_code[table.region == region].iloc[0]
+    elif region_code is None:
+        try:
+            region_code = int(region)
+        except (TypeError, ValueError):
+            pass
+    departments = table.department[table.region_code == region_code]
+    if departments.empty:
+        raise ValueError(f"Unknown region: {region}")
+    return list(departments)
+
+
+def get_raw_department_values(
+    data_source: str, departments: List[str]
+) -> list:
+    """Values of the department column of the raw data of `data_source`
+  (see DEPARTMENT_COLUMNS) for rows of `departments`
+
+  Raw ICUBAM department names may contain typos, which are included.
+  """
+    departments = set(departments)
+    if data_source == "bedcounts":
+        return sorted(departments) + sorted(
+            wrong_name
+            for wrong_name, right_name in load_department_typo_fixes().items()
+            if right_name in departments
+        )
+    elif data_source == "public":
+        table = get_department_table()
+        return list(table.index[table.department.isin(departments)])
+    raise ValueError(f"{data_source} data has no department column")
+
+
+def get_department_filters(data_source: str, departments: List[str]) -> Dict:
+    """Filters of load_data selecting the raw data of `departments`
+
+  The ICUs of ICU_DEPARTMENT_FIXES moved to one of `departments` by the
+  preprocessing are selected whatever their raw department, so that
+  selecting departments before or after the preprocessing is the same.
+  Rows of these ICUs moved away from `departments` may be selected as
+  well, they are dropped when the preprocessing restricts the data to a
+  region.
+  """
+    column = DEPARTMENT_COLUMNS.get(data_source)
+    values = get_raw_department_values(data_source, departments)
+    icu_names = []
+    if data_source == "bedcounts":
+        icu_names = sorted(
+            icu_name
+            for icu_name, department in ICU_DEPARTMENT_FIXES.items()
+            if department in departments
+        )
+    if not icu_names:
+        return {column: values}
+    return {(column, "icu_name"): (values, icu_names)}
+
+
+@functools.lru_cache(maxsize=None)
+def _france_departments():
     d = pd.read_json(DATA_PATHS["departments"])
-    d.loc[
-        d["departmentName"] == "Côtes-d'armor", "departmentName"
-    ] = "Côtes-d'Armor"
+    d["departmentName"] = d.departmentName.replace(DEPARTMENT_NAME_FIXES)
     return d
 
 
-CODE_TO_DEPARTMENT = dict(
-    load_france_departments()[["departmentCode", "departmentName"]].itertuples(
-        name=None, index=False,
-    ),
-)
-DEPARTMENT_TO_CODE = dict(
-    load_france_departments()[["departmentName", "departmentCode"]].itertuples(
-        name=None, index=False,
+@functools.lru_cache(maxsize=None)
+def _department_population():
+    # tuple of (department, population) pairs, cached values are immutable
+    return tuple(
+        pd.read_csv(DATA_PATHS["department_population"]).itertuples(
+            name=None, index=False
+        )
     )
-)
-DEPARTMENT_POPULATION = load_department_population()
-DEPARTMENTS = set(load_france_departments().departmentName.unique())
+
+
+@functools.lru_cache(maxsize=None)
+def _department_typo_fixes():
+    with open(DATA_PATHS["department_typo_fixes"]) as f:
+        fixes = json.load(f)
+    return tuple(
+        (wrong_name, DEPARTMENT_NAME_FIXES.get(right_name, right_name))
+        for wrong_name, right_name in fixes.items()
+    )
+
 
 CUM_COLUMNS = [
     "n_covid_deaths",
@@ -66,13 +218,75 @@ ALL_COLUMNS = (
     + CUM_COLUMNS
     + NCUM_COLUMNS
 )
+PUBLIC_COUNT_COLUMNS = [
+    "n_hospitalised_patients",
+    "n_icu_patients",
+    "n_hospital_healed",
+    "n_hospital_death",
+]
+# columns converted by compact_dtypes
+CATEGORICAL_COLUMNS = [
+    "icu_name",
+    "icu_dept",
+    "icu_city",
+    "department",
+    "department_code",
+    "region",
+    "icu_region_id",
+]
+DAY_COLUMNS = ["date"]
+DATETIME_COLUMNS = ["datetime", "create_date", "last_modified"]
+COUNT_COLUMNS = BEDCOUNT_COLUMNS + PUBLIC_COUNT_COLUMNS
+# raw bedcounts columns used by the preprocessing
+RAW_BEDCOUNTS_COLUMNS = [
+    "create_date",
+    "icu_name",
+    "icu_dept",
+    "icu_region_id",
+] + BEDCOUNT_COLUMNS
+# date and region columns of the raw data, used by load_data predicates
+DATE_COLUMNS = {"bedcounts": "create_date", "public": "date"}
+REGION_COLUMNS = {"bedcounts": "icu_region_id"}
+DEPARTMENT_COLUMNS = {"bedcounts": "icu_dept", "public": "department_code"}
+STORE_MAX_AGE = 3600
+PUBLIC_PAGE_URL = (
+    "https://www.data.gouv.fr/fr/datasets/"
+    "donnees-hospitalieres-relatives-a-lepidemie-de-covid-19/"
+)
+PUBLIC_FILENAME_PREFIX = "donnees-hospitalieres-covid19-2020"
+PUBLIC_URL_TTL = 3600
+PUBLIC_CHUNK_SIZE = 100000
+# columns of the data.gouv.fr hospital data CSV used by format_public
+PUBLIC_CSV_COLUMNS = ["dep", "sexe", "jour", "hosp", "rea", "rad", "dc"]
 
 
-def load_data(data_source: str, **kwargs):
+def load_data(
+    data_source: str,
+    columns: Optional[List[str]] = None,
+    min_date=None,
+    max_date=None,
+    regions: Optional[list] = None,
+    store_dir: Optional[str] = None,
+    max_store_age: float = STORE_MAX_AGE,
+    departments: Optional[List[str]] = None,
+    **kwargs,
+):
     """Generic data loader for various data sources
 
     Args:
       data_source: must be one of DATA_SOURCES
+      columns : columns to load, all by default
+      min_date, max_date : only load data with min_date <= date < max_date
+      regions : only load data of these regions (ICUBAM region ids, only
+        for bedcounts)
+      departments : only load data of these departments (names, see
+        get_region_departments for the departments of a region)
+      store_dir : directory of a columnar store of the raw data (see
+        predicu.store), downloaded data is written to the store and
+        data is read from it. The data is downloaded again when the store
+        is older than `max_store_age` seconds. Dates, regions and
+        departments are then selected while reading the store, before the
+        data is converted to pandas.
     """
     if data_source == "combined_bedcounts_public":
         raise ValueError(
@@ -81,17 +295,76 @@ def load_data(data_source: str, **kwargs):
         )
     elif data_source not in DATA_LOADERS:
         raise ValueError(f"data_source={data_source} not in {DATA_SOURCES}.")
+    filters = {}
+    if regions is not None:
+        if data_source not in REGION_COLUMNS:
+            raise ValueError(f"{data_source} data has no region column")
+        filters[REGION_COLUMNS[data_source]] = list(regions)
+    if departments is not None:
+        filters.update(get_department_filters(data_source, departments))
 
     func = DATA_LOADERS[data_source]
-    # If kwargs are wrong, this will explicitly fail. It's up to the user to pass
-    # correct arguments for each data loader.
-    return func(**kwargs)
+    if store_dir is None:
+        # If kwargs are wrong, this will explicitly fail. It's up to the user
+        # to pass correct arguments for each data loader.
+        d = func(**kwargs)
+        return _select(
+            d,
+            DATE_COLUMNS[data_source],
+            columns,
+            min_date,
+            max_date,
+            filters,
+        )
+
+    path = os.path.join(store_dir, data_source)
+    age = store_age(path)
+    if age is None or age > max_store_age:
+        write_store(path, func(**kwargs), DATE_COLUMNS[data_source])
+    else:
+        logging.info("reading %s data from %s" % (data_source, path))
+    return read_store(
+        path,
+        columns=columns,
+        min_date=min_date,
+        max_date=max_date,
+        filters=filters,
+    )
+
+
+def _select(d, date_column, columns, min_date, max_date, filters):
+    """In memory equivalent of the predicates of read_store"""
+    mask = pd.Series(True, index=d.index)
+    dates = pd.to_datetime(d[date_column])
+    if min_date is not None:
+        mask &= dates >= pd.Timestamp(min_date)
+    if max_date is not None:
+        mask &= dates < pd.Timestamp(max_date)
+    for col, values in filters.items():
+        if isinstance(col, tuple):
+            mask &= np.logical_or.reduce(
+                [d[c].isin(v) for c, v in zip(col, values)]
+            )
+        else:
+            mask &= d[col].isin(values)
+    if not mask.all():
+        d = d.loc[mask]
+    if columns is not None:
+        d = d[columns]
+    return d
 
 
 def load_bedcounts(
-    api_key=None, icubam_host=None,
+    api_key=None, icubam_host=None, store_path=None, compact=False,
 ):
-    """Load Bedcount data from ICUBAM API"""
+    """Load Bedcount data from ICUBAM API
+
+  Args:
+    store_path : path of a local CSV copy of the raw bedcounts. When given,
+      only the inputs created since the most recent input of the store are
+      downloaded and appended to the store, and the whole store is returned.
+    compact : use compact dtypes, see compact_dtypes
+  """
     if api_key is None or icubam_host is None:
         raise RuntimeError("Provide API key and host to download ICUBAM data")
     else:
@@ -100,13 +373,48 @@ def load_bedcounts(
             f"{protocol}://{icubam_host}/"
             f"db/all_bedcounts?format=csv&API_KEY={api_key}"
         )
-        logging.info("downloading data from %s" % url)
-        d = pd.read_csv(url.format(api_key))
+        if store_path is None:
+            logging.info("downloading data from %s" % url)
+            d = read_csv_url(url)
+        else:
+            d = _update_bedcounts_store(url, store_path)
     d = d.sort_values(by=["create_date", "icu_name"])
+    if compact:
+        d = compact_dtypes(d)
     return d
 
 
-def load_pre_icubam(data_path):
+def _update_bedcounts_store(url, store_path):
+    """Download the inputs missing from the store and return the store"""
+    # the store replaces the HTTP response cache
+    if not os.path.isfile(store_path):
+        logging.info("downloading data from %s" % url)
+        d = read_csv_url(url, use_cache=False)
+        tmp_path = f"{store_path}.tmp"
+        d.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, store_path)
+        return d
+
+    stored = pd.read_csv(store_path, usecols=["rowid", "create_date"])
+    if len(stored) > 0:
+        # high-water mark, inputs created at the same time may not all have
+        # been downloaded yet so they are requested again
+        since = pd.to_datetime(stored.create_date).max()
+        url += "&" + urllib.parse.urlencode({"since": since.isoformat()})
+    logging.info("downloading data from %s" % url)
+    new = read_csv_url(url, use_cache=False)
+    if len(stored) > 0:
+        # older servers ignore `since`
+        new = new.loc[pd.to_datetime(new.create_date) >= since]
+    new = new.loc[~new.rowid.isin(stored.rowid)]
+    if len(new) > 0:
+        logging.info("adding %d inputs to %s" % (len(new), store_path))
+        columns = pd.read_csv(store_path, nrows=0).columns
+        new[columns].to_csv(store_path, mode="a", header=False, index=False)
+    return pd.read_csv(store_path)
+
+
+def load_pre_icubam(data_path, compact=False, date_as_object=False):
     d = _load_any_file(data_path)
     d = d.rename(
         columns={
@@ -140,7 +448,7 @@ def load_pre_icubam(data_path):
     ]
     for col in missing_columns:
         d[col] = 0
-    d = format_data(d)
+    d = format_data(d, compact=compact, date_as_object=date_as_object)
     return d
 
 
@@ -153,34 +461,124 @@ def _load_any_file(data_path):
         d = pd.read_hdf(data_path)
     elif ext == "csv":
         d = pd.read_csv(data_path)
+    elif ext in ["feather", "arrow"]:
+        d = pd.read_feather(data_path)
+    elif ext == "parquet":
+        d = pd.read_parquet(data_path)
     else:
         raise ValueError(f"unknown extension {ext}")
     return d
 
 
-def load_public():
-    filename_prefix = "donnees-hospitalieres-covid19-2020"
+def load_public(
+    compact=False,
+    date_as_object=False,
+    page_url=PUBLIC_PAGE_URL,
+    url_ttl=PUBLIC_URL_TTL,
+    chunksize=PUBLIC_CHUNK_SIZE,
+):
+    """Hospital data for both sexes from data.gouv.fr
+
+  The CSV is read by chunks of `chunksize` rows, only the rows for both
+  sexes of each chunk are kept.
+
+  Args:
+    compact : use compact dtypes, see compact_dtypes
+    date_as_object : dates are datetime.date objects instead of datetime64
+    page_url : data.gouv.fr dataset page listing the CSV
+    url_ttl : seconds during which the CSV URL found in the page is reused
+  """
+    download_url, cached = resolve_public_url(page_url, url_ttl)
+    try:
+        d = _read_public_csv(download_url, compact, chunksize)
+    except requests.HTTPError:
+        if not cached:
+            raise
+        # the CSV was replaced since the URL was cached
+        download_url, _ = resolve_public_url(page_url, ttl=0)
+        d = _read_public_csv(download_url, compact, chunksize)
+    if date_as_object:
+        d = dates_as_objects(d, ["date"])
+    return d
+
+
+def resolve_public_url(page_url=PUBLIC_PAGE_URL, ttl=PUBLIC_URL_TTL):
+    """URL of the hospital data CSV listed in the data.gouv.fr page
+
+  The URL is cached in `get_cache_dir()` for `ttl` seconds. Returns the URL
+  and whether it came from the cache.
+  """
+    from predicu.cache import get_cache_dir
+
+    cache_path = get_cache_dir() / "public_url.json"
+    if cache_path.is_file():
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if (
+            cached["page_url"] == page_url
+            and time.time() - cached["resolved"] < ttl
+        ):
+            return cached["url"], True
     logging.info("scrapping public data")
-    url = (
-        "https://www.data.gouv.fr/fr/datasets/"
-        "donnees-hospitalieres-relatives-a-lepidemie-de-covid-19/"
-    )
-    with urllib.request.urlopen(url) as f:
-        html_content = f.read().decode("utf8")
+    download_url = find_public_resource(read_text_url(page_url), page_url)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    resolved = {
+        "page_url": page_url,
+        "url": download_url,
+        "resolved": time.time(),
+    }
+    with open(tmp_path, "w") as f:
+        json.dump(resolved, f)
+    os.replace(tmp_path, cache_path)
+    return download_url, False
+
+
+def find_public_resource(html_content, page_url=PUBLIC_PAGE_URL):
+    """URL of the first resource of the page named PUBLIC_FILENAME_PREFIX*"""
     tree = html.fromstring(html_content)
-    download_url = None
-    elements = tree.xpath('//*[contains(@class, "resource-card")]')
-    for e in elements:
-        resource_name = e.xpath('//*[contains(@class, "ellipsis")]/text()')[0]
-        if resource_name.startswith(filename_prefix):
-            download_url = e.xpath("//*[@download]/@href")[0]
+    for e in tree.xpath('//*[contains(@class, "resource-card")]'):
+        # paths relative to the card, not to the document
+        names = e.xpath('.//*[contains(@class, "ellipsis")]/text()')
+        hrefs = e.xpath(".//*[@download]/@href")
+        if not names or not hrefs:
+            continue
+        resource_name = names[0].strip()
+        if resource_name.startswith(PUBLIC_FILENAME_PREFIX):
+            download_url = urllib.parse.urljoin(page_url, hrefs[0])
             logging.info(
                 "found resource %s at %s" % (resource_name, download_url)
             )
-            break
-    if download_url is None:
-        raise Exception("Could not scrap public data")
-    d = pd.read_csv(download_url, sep=";",)
+            return download_url
+    raise Exception("Could not scrap public data")
+
+
+def _read_public_csv(url, compact, chunksize):
+    chunks = []
+    with open_url(url) as f:
+        reader = pd.read_csv(
+            f,
+            sep=";",
+            usecols=PUBLIC_CSV_COLUMNS,
+            dtype={"dep": str},
+            chunksize=chunksize,
+        )
+        for chunk in reader:
+            chunks.append(format_public(chunk, compact=compact))
+    d = pd.concat(chunks, ignore_index=True)
+    if compact:
+        # categories of the chunks differ
+        d = compact_dtypes(d)
+    return d
+
+
+def format_public(d, compact=False, date_as_object=False):
+    """Format the hospital data CSV from data.gouv.fr
+
+  Args:
+    compact : use compact dtypes, see compact_dtypes
+    date_as_object : dates are datetime.date objects instead of datetime64
+  """
     d = d.loc[d.sexe == 0]
     d = d.rename(
         columns={
@@ -192,51 +590,137 @@ def load_public():
             "dc": "n_hospital_death",
         }
     )
-    d["date"] = pd.to_datetime(d["date"]).dt.date
-    return d[
-        [
-            "date",
-            "department_code",
-            "n_hospitalised_patients",
-            "n_icu_patients",
-            "n_hospital_healed",
-            "n_hospital_death",
-        ]
-    ]
+    d["date"] = to_datetime64(d["date"])
+    d = d[["date", "department_code"] + PUBLIC_COUNT_COLUMNS]
+    if compact:
+        d = compact_dtypes(d)
+    if date_as_object:
+        d = dates_as_objects(d, ["date"])
+    return d
 
 
 def combine_bedcounts_public(
-    public_data: pd.DataFrame, bedcount_data: pd.DataFrame
+    public_data: pd.DataFrame,
+    bedcount_data: pd.DataFrame,
+    regions: Optional[list] = None,
+    dates: Optional[list] = None,
 ) -> pd.DataFrame:
-    """Combine **preprocessed** public and ICUBAM data"""
-    get_dpt_pop = load_department_population().get
-    dp = public_data
+    """Combine **preprocessed** public and ICUBAM data
+
+  ICU data is summed per date and department and joined with the public data
+  of the department, on positions of department codes in
+  `get_department_table()`. There is one row per date and department with
+  data in both sources, sorted by date and department code. The inputs are
+  not modified.
+
+  Args:
+    regions : only combine the departments of ICUs of these regions
+    dates : only combine these dates
+  """
+    table = get_department_table()
     di = bedcount_data
-    dp["department"] = dp.department_code.apply(CODE_TO_DEPARTMENT.get)
-    dpt_to_region = dict(
-        di.groupby(["department", "region"])
-        .first()
-        .reset_index()[["department", "region"]]
-        .itertuples(name=None, index=False)
+    dp = public_data
+    if regions is not None:
+        di = di.loc[di.region.isin(regions)]
+    if dates is not None:
+        dates = pd.to_datetime(list(dates))
+        di = di.loc[pd.to_datetime(di.date).isin(dates)]
+        dp = dp.loc[pd.to_datetime(dp.date).isin(dates)]
+
+    icu_dpt = pd.Index(table.department).get_indexer(di.department)
+    known = icu_dpt >= 0
+    di = di.loc[known]
+    icu_dpt = icu_dpt[known]
+    counts = di[CUM_COLUMNS + NCUM_COLUMNS]
+    by = [pd.Index(di.date.values, name="date"), pd.Index(icu_dpt, name="dpt")]
+    dpt_region = di.region.groupby(icu_dpt).first()
+    di = counts.groupby(by, sort=True).sum().reset_index()
+    di["n_icu_patients"] = di.n_covid_occ + di.n_ncovid_occ
+
+    public_dpt = table.index.get_indexer(dp.department_code)
+    dp = pd.DataFrame(
+        dict(
+            date=dp.date.values,
+            dpt=public_dpt,
+            **{col: dp[col].values for col in PUBLIC_COUNT_COLUMNS},
+        )
     )
-    di = di.groupby(["date", "department"]).sum().reset_index()
-    di["department_code"] = di.department.apply(DEPARTMENT_TO_CODE.get)
-    di["n_icu_patients"] = di.n_covid_occ + di.n_ncovid_occ.fillna(0)
     d = di.merge(
-        dp, on=["department", "date"], suffixes=["_icubam", "_public"]
+        dp.loc[public_dpt >= 0],
+        on=["date", "dpt"],
+        suffixes=["_icubam", "_public"],
     )
-    d["department_pop"] = d.department.apply(get_dpt_pop)
-    d["region"] = d.department.apply(dpt_to_region.get)
+    dpt = d.pop("dpt").values
+    d.insert(1, "department", table.department.values[dpt])
+    d["department_code"] = table.index.values[dpt]
+    d["department_pop"] = table.population.values[dpt]
+    d["region"] = dpt_region.reindex(dpt).values
     return d
 
 
-def format_data(d):
-    d["datetime"] = pd.to_datetime(d["date"])
-    d["date"] = d["datetime"].dt.date
+def format_data(d, compact=False, date_as_object=False):
+    """Rename the date column to datetime and add the day as date
+
+  Args:
+    compact : use compact dtypes, see compact_dtypes
+    date_as_object : dates are datetime.date objects instead of datetime64
+  """
+    d["datetime"] = to_datetime64(d["date"])
+    d["date"] = d["datetime"].dt.normalize()
     d = d[ALL_COLUMNS]
+    if compact:
+        d = compact_dtypes(d)
+    if date_as_object:
+        d = dates_as_objects(d, ["date"])
     return d
 
 
+def to_datetime64(values) -> pd.Series:
+    """datetime64[ns] Series, whatever the resolution the values are parsed
+  with"""
+    return pd.Series(pd.to_datetime(values)).astype("datetime64[ns]")
+
+
+def dates_as_objects(d: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Convert datetime64 `columns` to datetime.date objects, as they were
+  before dates were stored as datetime64"""
+    return d.assign(**{col: d[col].dt.date for col in columns})
+
+
+def compact_dtypes(d: pd.DataFrame) -> pd.DataFrame:
+    """Convert the columns of `d` to compact dtypes
+
+  Names (CATEGORICAL_COLUMNS) become categoricals, dates (DAY_COLUMNS)
+  datetime64 at midnight, timestamps (DATETIME_COLUMNS) datetime64 and counts
+  (COUNT_COLUMNS) the smallest signed integer type of at least 16 bits
+  holding their values, so that sums of a few columns do not overflow.
+  Counts with missing values become float32.
+  """
+    columns = {}
+    for col in d.columns:
+        if col in CATEGORICAL_COLUMNS:
+            columns[col] = d[col].astype("category")
+        elif col in DAY_COLUMNS:
+            columns[col] = to_datetime64(d[col]).dt.normalize()
+        elif col in DATETIME_COLUMNS:
+            columns[col] = to_datetime64(d[col])
+        elif col in COUNT_COLUMNS:
+            columns[col] = _downcast_counts(d[col])
+    return d.assign(**columns)
+
+
+def _downcast_counts(s):
+    if s.isna().any():
+        return s.astype("float32")
+    s = pd.to_numeric(s, downcast="integer")
+    if s.dtype.kind == "f":
+        # interpolated values
+        return s.astype("float32")
+    if s.dtype.itemsize < 2:
+        s = s.astype("int16")
+    return s
+
+
 DATA_LOADERS: Dict[str, Callable] = {
     "bedcounts": load_bedcounts,
     "public": load_public,
@@ -0,0 +1,176 @@
+"""HTTP layer shared by the data loaders
+
+All the requests go through one pooled session asking for gzip. Responses
+with an ETag or a Last-Modified header are kept compressed in
+`get_cache_dir()/http` and revalidated with If-None-Match and
+If-Modified-Since, so that unchanged data is not downloaded again.
+Response bodies are decompressed while they are read, e.g. by the CSV
+parser.
+"""
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+import pandas as pd
+import requests
+
+HTTP_CACHE_MAX_SIZE = 1024 ** 3
+HTTP_CACHE_MAX_AGE = 30 * 24 * 3600
+TIMEOUT = 60
+CHUNK_SIZE = 1024 ** 2
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Session shared by all the loaders, connections are reused"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=16, max_retries=3
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["Accept-Encoding"] = "gzip"
+    return _session
+
+
+@contextlib.contextmanager
+def open_url(url: str, use_cache: bool = True) -> Iterator[BinaryIO]:
+    """Open `url` as a decompressed binary stream
+
+  Args:
+    use_cache : revalidate and store the response in the local response
+      cache
+  """
+    cache_path = _cache_path(url) if use_cache else None
+    meta = _read_meta(cache_path) if use_cache else None
+    headers = {}
+    if meta is not None:
+        if meta["etag"] is not None:
+            headers["If-None-Match"] = meta["etag"]
+        if meta["last_modified"] is not None:
+            headers["If-Modified-Since"] = meta["last_modified"]
+    with get_session().get(
+        url, headers=headers, stream=True, timeout=TIMEOUT
+    ) as r:
+        if r.status_code == 304 and meta is not None:
+            logging.info("%s not modified, using cached response" % r.url)
+            # mark as recently used
+            os.utime(cache_path)
+            os.utime(cache_path.with_suffix(".json"))
+            with open(cache_path, "rb") as f:
+                yield _decompress(f, meta["content_encoding"])
+            return
+        r.raise_for_status()
+        content_encoding = r.headers.get("Content-Encoding")
+        # r.raw returns the body as it was sent, before decompression
+        if not use_cache or not (
+            "ETag" in r.headers or "Last-Modified" in r.headers
+        ):
+            yield _decompress(r.raw, content_encoding)
+            return
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        f = tempfile.NamedTemporaryFile(
+            dir=cache_path.parent, suffix=".tmp", delete=False
+        )
+        tmp_path = Path(f.name)
+        try:
+            with f:
+                tee = _TeeReader(r.raw, f)
+                yield _decompress(tee, content_encoding)
+                # the caller may not have read the whole body
+                while tee.read(CHUNK_SIZE):
+                    pass
+            os.replace(tmp_path, cache_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        _write_meta(
+            cache_path,
+            {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "content_encoding": content_encoding,
+            },
+        )
+    from predicu.cache import evict
+
+    evict(
+        cache_path.parent,
+        max_size=HTTP_CACHE_MAX_SIZE,
+        max_age=HTTP_CACHE_MAX_AGE,
+    )
+
+
+def read_csv_url(
+    url: str, use_cache: bool = True, **kwargs
+) -> pd.DataFrame:
+    """pd.read_csv of `url`, streamed through `open_url`"""
+    with open_url(url, use_cache=use_cache) as f:
+        return pd.read_csv(f, **kwargs)
+
+
+def read_text_url(url: str, use_cache: bool = True) -> str:
+    with open_url(url, use_cache=use_cache) as f:
+        return f.read().decode("utf8")
+
+
+class _TeeReader(io.RawIOBase):
+    """Binary stream writing what is read from `f` to `sink`"""
+
+    def __init__(self, f, sink):
+        self.f = f
+        self.sink = sink
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.f.read(len(b))
+        self.sink.write(data)
+        b[: len(data)] = data
+        return len(data)
+
+
+def _decompress(f, content_encoding):
+    if content_encoding == "gzip":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    elif content_encoding in [None, "identity"]:
+        return f
+    raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+
+
+def _cache_path(url) -> Path:
+    from predicu.cache import get_cache_dir
+
+    # URLs may contain API keys, only their hashes are stored
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return get_cache_dir() / "http" / f"{key}.body"
+
+
+def _read_meta(cache_path) -> Optional[dict]:
+    meta_path = cache_path.with_suffix(".json")
+    if not (cache_path.is_file() and meta_path.is_file()):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _write_meta(cache_path, meta):
+    meta_path = cache_path.with_suffix(".json")
+    tmp_path = meta_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
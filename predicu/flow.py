@@ -4,7 +4,7 @@ from predicu.data import CUM_COLUMNS
 
 
 def compute_flow(d):
-    sum_cols = set(CUM_COLUMNS + ["n_covid_occ"]) - {"n_covid_refused"}
+    sum_cols = sorted(set(CUM_COLUMNS + ["n_covid_occ"]) - {"n_covid_refused"})
     summed = d[sum_cols].sum(axis=1)
     flow = summed.diff(1).fillna(0)
     flow.iloc[0] = summed.iloc[0]
@@ -12,10 +12,11 @@ def compute_flow(d):
 
 
 def compute_flow_per_dpt(data):
+    """`data` with the flow and cumulated flow of its department, `data` is
+  not modified"""
     dfs = []
     for dpt, d in data.groupby("department"):
         d = d.sort_values(by="date")
-        d["flow"] = compute_flow(d)
-        d["cum_flow"] = d.flow.cumsum()
-        dfs.append(d)
+        flow = compute_flow(d)
+        dfs.append(d.assign(flow=flow, cum_flow=flow.cumsum()))
     return pd.concat(dfs)
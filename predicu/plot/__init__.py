@@ -1,7 +1,10 @@
+import concurrent.futures
+import inspect
 import itertools
+import json
 import logging
 import os
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -11,8 +14,17 @@ import pandas as pd
 import scipy
 import seaborn
 
-from predicu.data import BEDCOUNT_COLUMNS, combine_bedcounts_public, load_data
-from predicu.preprocessing import preprocess_data
+from predicu.cache import IGNORED_KWARGS, cached_preprocess_data
+from predicu.data import (
+    BEDCOUNT_COLUMNS,
+    RAW_BEDCOUNTS_COLUMNS,
+    combine_bedcounts_public,
+    get_region_departments,
+    load_data,
+)
+from predicu.flow import compute_flow_per_dpt
+from predicu.plot_registry import get_plots
+from predicu.preprocessing import PREPROCESSORS, preprocess_data
 
 COLUMN_TO_HUMAN_READABLE = {
     "n_covid_deaths": "Deaths",
@@ -28,10 +40,12 @@ COLUMN_TO_HUMAN_READABLE = {
     "pct_healed": "Percentage of ICU exits",
 }
 
-COL_COLOR = {
-    col: seaborn.color_palette("colorblind", len(BEDCOUNT_COLUMNS) + 1)[i]
-    for i, col in enumerate(BEDCOUNT_COLUMNS + ["flow"])
-}
+COL_COLOR = dict(
+    zip(
+        BEDCOUNT_COLUMNS + ["flow"],
+        seaborn.color_palette("colorblind", len(BEDCOUNT_COLUMNS) + 1),
+    )
+)
 COL_COLOR.update(
     {
         "n_covid_deaths": (0, 0, 0),
@@ -67,16 +81,39 @@ DEPARTMENTS_GRAND_EST = [
     "Haut-Rhin",
     "Vosges",
 ]
-DEPARTMENT_COLOR = {
-    dpt: seaborn.color_palette("colorblind", len(DEPARTMENTS_GRAND_EST))[i]
-    for i, dpt in enumerate(sorted(DEPARTMENTS_GRAND_EST))
-}
+DEPARTMENT_COLOR = dict(
+    zip(
+        sorted(DEPARTMENTS_GRAND_EST),
+        seaborn.color_palette("colorblind", len(DEPARTMENTS_GRAND_EST)),
+    )
+)
 # DEPARTMENT_COLOR = {
 # dpt: seaborn.color_palette("colorblind", len(DEPARTMENTS))[i]
 # for i, dpt in enumerate(sorted(DEPARTMENTS))
 # }
-RANDOM_MARKERS = itertools.cycle(("x", "+", ".", "|"))
-RANDOM_COLORS = itertools.cycle(seaborn.color_palette("colorblind", 10))
+
+
+class _Cycle:
+    """itertools.cycle which can be restarted"""
+
+    def __init__(self, values):
+        self.values = list(values)
+        self.reset()
+
+    def reset(self):
+        self._cycle = itertools.cycle(self.values)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._cycle)
+
+
+# restarted for each plot, so that plots do not depend on the plots drawn
+# before them in the same process
+RANDOM_MARKERS = _Cycle(("x", "+", ".", "|"))
+RANDOM_COLORS = _Cycle(seaborn.color_palette("colorblind", 10))
 
 
 def plot_int(
@@ -104,11 +141,154 @@ def plot_int(
     return ax
 
 
-PLOTS = []
-for path in os.listdir(os.path.dirname(__file__)):
-    if path.endswith(".py") and path != "__init__.py":
-        plot_name = path.rsplit(".", 1)[0]
-        PLOTS.append(plot_name)
+def format_dates(dates, date_format="%d-%m"):
+    """Format dates (datetime64 or datetime.date) as strings for labels"""
+    return list(pd.to_datetime(pd.Index(dates)).strftime(date_format))
+
+
+def dept_daily_sum(d: pd.DataFrame) -> pd.DataFrame:
+    """Bedcounts summed per date and department, sorted by date and
+  department"""
+    return (
+        d.groupby(["date", "department"])[BEDCOUNT_COLUMNS]
+        .sum()
+        .reset_index()
+    )
+
+
+def dept_daily_diff(d: pd.DataFrame) -> pd.DataFrame:
+    """Differences between consecutive days of `dept_daily_sum` in each
+  department, 0 on the first day of the department"""
+    diff = d.groupby("department")[BEDCOUNT_COLUMNS].diff(1).fillna(0)
+    return d.assign(**{col: diff[col] for col in BEDCOUNT_COLUMNS})
+
+
+def region_daily_sum(d: pd.DataFrame) -> pd.DataFrame:
+    """Bedcounts of all the ICUs of the data (the region it is restricted
+  to) summed per date, sorted by date"""
+    return d.groupby("date")[BEDCOUNT_COLUMNS].sum().reset_index()
+
+
+def dept_flow(d: pd.DataFrame) -> pd.DataFrame:
+    """`dept_daily_sum` with the daily and cumulated flows of patients of
+  each department, see predicu.flow"""
+    return compute_flow_per_dpt(d)
+
+
+# data derived from other sources, which plots can list in their
+# `data_source`: name -> (names of the inputs, function of the inputs). Each
+# derived dataset is computed once per generate_plots run.
+DERIVED_DATA = {
+    "combined_bedcounts_public": (
+        ["public", "bedcounts"],
+        combine_bedcounts_public,
+    ),
+    "dept_daily_sum": (["bedcounts"], dept_daily_sum),
+    "dept_daily_diff": (["dept_daily_sum"], dept_daily_diff),
+    "region_daily_sum": (["bedcounts"], region_daily_sum),
+    "dept_flow": (["dept_daily_sum"], dept_flow),
+}
+
+# see predicu.plot_registry
+PLOTS = list(get_plots())
+
+
+def read_only(d: pd.DataFrame) -> pd.DataFrame:
+    """Frame sharing the data of `d`, for plots
+
+  Plot functions must not modify the values of their data, they may only
+  add columns to the frame they receive. A shallow copy of `d` is returned
+  and no data is copied. With pandas copy-on-write (always enabled from
+  pandas 3.0, or with the mode.copy_on_write option), writing values in the
+  returned frame copies them first. Otherwise the NumPy arrays of `d` are
+  made non-writeable, which also applies to `d`: a plot writing values in
+  its data fails instead of modifying the data of the other plots.
+  Extension arrays (e.g. categoricals) are not protected then.
+  """
+    if not _copy_on_write():
+        _freeze(d)
+    return d.copy(deep=False)
+
+
+def _copy_on_write():
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except KeyError:  # pandas < 1.5
+        return False
+
+
+def _freeze(d):
+    manager = getattr(d, "_mgr", None)
+    if manager is None:  # pandas < 1.1
+        manager = d._data
+    for block in manager.blocks:
+        if isinstance(block.values, np.ndarray):
+            block.values.flags.writeable = False
+
+
+def raw_data_sources(data_source: Iterable[str]) -> List[str]:
+    """Raw sources to load for `data_source`, sources of DATA_SOURCES or
+  DERIVED_DATA"""
+    sources = []
+    for name in data_source:
+        if name in DERIVED_DATA:
+            sources += raw_data_sources(DERIVED_DATA[name][0])
+        else:
+            sources.append(name)
+    return list(dict.fromkeys(sources))
+
+
+def load_raw_data(
+    data_source: Iterable[str],
+    cached_data: Dict[str, pd.DataFrame],
+    api_key: Optional[str] = None,
+    icubam_host: Optional[str] = None,
+    store_dir: Optional[str] = None,
+    restrict_to_region: Optional[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Load the raw sources of `data_source` missing from `cached_data`
+
+  Loading is dominated by network and parsing latency, so sources are
+  loaded concurrently in threads, each at most once. `cached_data` is
+  updated in place and returned.
+
+  Args:
+    restrict_to_region : only load the data of the departments of this
+      region
+  """
+    departments = None
+    if restrict_to_region is not None:
+        departments = get_region_departments(restrict_to_region)
+    missing = [
+        name
+        for name in raw_data_sources(data_source)
+        if name not in cached_data
+    ]
+    if not missing:
+        return cached_data
+    with concurrent.futures.ThreadPoolExecutor(len(missing)) as executor:
+        futures = {}
+        for name in missing:
+            if name == "bedcounts":
+                kwargs = dict(
+                    api_key=api_key,
+                    icubam_host=icubam_host,
+                    columns=RAW_BEDCOUNTS_COLUMNS,
+                )
+            else:
+                kwargs = {}
+            futures[name] = executor.submit(
+                load_data,
+                name,
+                store_dir=store_dir,
+                departments=departments,
+                **kwargs,
+            )
+        for name, future in futures.items():
+            cached_data[name] = future.result()
+    return cached_data
 
 
 def plot(
@@ -120,59 +300,121 @@ def plot(
     icubam_host: Optional[str],
     matplotlib_style: str,
     restrict_to_region: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    store_dir: Optional[str] = None,
+    memo: Optional[Dict] = None,
 ):
     """Generate one plot
 
   Args:
     plot_name: name of the plot to make. Must match one of the files in plot/
     cached_data : a dictionary with **raw** data for different sources.
+    cache_dir : directory where preprocessed data is cached, no cache if None
+    store_dir : directory of the columnar store of raw data, see load_data
+    memo : preprocessed data shared between plots, see get_plot_data
   """
-    plot_module = __import__(f"{plot_name}", globals(), locals(), ["plot"], 1)
-    plot_fun = plot_module.plot  # type: ignore
+    plot_data = get_plot_data(
+        plot_name,
+        cached_data,
+        api_key=api_key,
+        icubam_host=icubam_host,
+        restrict_to_region=restrict_to_region,
+        cache_dir=cache_dir,
+        store_dir=store_dir,
+        memo=memo,
+    )
+    render_plot(
+        plot_name, plot_data, output_dir, output_type, matplotlib_style
+    )
 
-    data_source = plot_module.data_source.copy()  # type: ignore
-    needs_combined_data = "combined_bedcounts_public" in data_source
-    if needs_combined_data:
-        data_source.remove("combined_bedcounts_public")
-        # load requied data to make combined dataset
-        data_source += ["bedcounts", "public"]
 
-    # load required raw data if it's missing
-    for name in data_source:
-        if name not in cached_data:
-            if name == "bedcounts":
-                kwargs = dict(api_key=api_key, icubam_host=icubam_host,)
-            else:
-                kwargs = {}
-            cached_data[name] = load_data(name, **kwargs)
+def get_plot_data(
+    plot_name: str,
+    cached_data: Dict[str, pd.DataFrame],
+    api_key: Optional[str] = None,
+    icubam_host: Optional[str] = None,
+    restrict_to_region: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    store_dir: Optional[str] = None,
+    memo: Optional[Dict] = None,
+):
+    """Preprocessed data passed to the `plot` function of a plot module
 
-    # preprocess the subset of data necessary this plot
-    plot_data = {}
-    for name in data_source:
-        data = cached_data[name].copy()
-        kwargs = getattr(plot_module, "preprocesing_args", {}).get(
-            name, {}
-        )  # type: ignore
+  Raw data missing from `cached_data` is loaded, see `plot` for the
+  arguments. The data is shared with `memo` and other plots through
+  `read_only`.
+
+  Args:
+    memo : preprocessed and derived data (see DERIVED_DATA) of previous
+      calls with the same `cached_data`, keyed by source and preprocessing
+      arguments. Data found in `memo` is not computed again, new data is
+      added to it.
+  """
+    data_source = get_plots()[plot_name]["data_source"]
+    preprocesing_args = get_plots()[plot_name]["preprocesing_args"]
+
+    load_raw_data(
+        data_source,
+        cached_data,
+        api_key=api_key,
+        icubam_host=icubam_host,
+        store_dir=store_dir,
+        restrict_to_region=restrict_to_region,
+    )
 
+    if memo is None:
+        memo = {}
+
+    def get_data(name):
+        """Data of source `name` and its key in `memo`"""
+        if name in DERIVED_DATA:
+            inputs, func = DERIVED_DATA[name]
+            results = [get_data(input_name) for input_name in inputs]
+            key = (name,) + tuple(key for _, key in results)
+            if key not in memo:
+                memo[key] = func(*[data for data, _ in results])
+            return memo[key], key
+
+        kwargs = dict(preprocesing_args.get(name, {}))
         if name == "bedcounts":
             kwargs["restrict_to_region"] = restrict_to_region
+        key = _memo_key(name, kwargs)
+        if key not in memo:
+            # preprocessing does not modify the raw data
+            if cache_dir is not None:
+                memo[key] = cached_preprocess_data(
+                    name, cached_data[name], cache_dir=cache_dir, **kwargs
+                )
+            else:
+                memo[key] = preprocess_data(name, cached_data[name], **kwargs)
+        return memo[key], key
 
-        plot_data[name] = preprocess_data(name, data, **kwargs)
+    plot_data = {name: read_only(get_data(name)[0]) for name in data_source}
+    if len(data_source) == 1:
+        plot_data = plot_data[data_source[0]]
+    return plot_data
 
-    if needs_combined_data:
-        plot_data["combined_bedcounts_public"] = combine_bedcounts_public(
-            plot_data["public"], plot_data["bedcounts"]
-        )
-        data_source.remove("bedcounts")
-        data_source.remove("public")
-        data_source.append("combined_bedcounts_public")
 
+def render_plot(
+    plot_name: str,
+    plot_data,
+    output_dir: str,
+    output_type: str,
+    matplotlib_style: str,
+):
+    """Draw a plot from the data returned by `get_plot_data` and save its
+  figures in `output_dir`"""
+    plot_fun = _import_plot(plot_name).plot  # type: ignore
+    # data unpickled in a rendering process is read-only as well
+    if isinstance(plot_data, dict):
+        plot_data = {name: read_only(d) for name, d in plot_data.items()}
+    else:
+        plot_data = read_only(plot_data)
+    RANDOM_MARKERS.reset()
+    RANDOM_COLORS.reset()
     matplotlib.use("agg")
     matplotlib.style.use(matplotlib_style)
 
-    if len(data_source) == 1:
-        plot_data = plot_data[data_source[0]]
-
     figs, tikzplotlib_kwargs = plot_fun(data=plot_data)
 
     if not isinstance(figs, dict):
@@ -204,7 +446,20 @@ def generate_plots(
     output_dir: str = "/tmp",
     cached_data: Dict = None,
     restrict_to_region: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    store_dir: Optional[str] = None,
+    n_jobs: int = 1,
 ):
+    """Generate plots in `output_dir`, all of them by default
+
+  Args:
+    n_jobs : number of processes rendering the plots (-1 for all the
+      processors). The data is loaded and preprocessed in the calling
+      process. Whatever `n_jobs`, plots that fail are reported and the
+      other plots are still rendered, then a RuntimeError is raised.
+  """
+    if n_jobs == 0 or n_jobs < -1:
+        raise ValueError(f"n_jobs must be at least 1 or -1, got {n_jobs}")
     if cached_data is None:
         cached_data = dict()
     if plots is None:
@@ -218,15 +473,116 @@ def generate_plots(
         raise ValueError(
             "Unknown plot(s): {}".format(", ".join(plots_unknown))
         )
-    for name in sorted(plots):
-        logging.info("generating plot %s in %s" % (name, output_dir))
-        plot(
-            name,
-            cached_data=cached_data,
-            matplotlib_style=matplotlib_style,
-            output_dir=output_dir,
-            output_type=output_type,
-            api_key=api_key,
-            icubam_host=icubam_host,
-            restrict_to_region=restrict_to_region,
-        )
+    # all the raw data needed by the plots is loaded at once
+    data_source = [
+        name
+        for plot_name in plots
+        for name in get_plots()[plot_name]["data_source"]
+    ]
+    load_raw_data(
+        data_source,
+        cached_data,
+        api_key=api_key,
+        icubam_host=icubam_host,
+        store_dir=store_dir,
+        restrict_to_region=restrict_to_region,
+    )
+    # each distinct preprocessed dataset is computed once for all the plots
+    memo: Dict = {}
+    if n_jobs < 0:
+        n_jobs = os.cpu_count()
+    failed = []
+    if n_jobs == 1:
+        for name in plots:
+            logging.info("generating plot %s in %s" % (name, output_dir))
+            try:
+                plot(
+                    name,
+                    cached_data=cached_data,
+                    matplotlib_style=matplotlib_style,
+                    output_dir=output_dir,
+                    output_type=output_type,
+                    api_key=api_key,
+                    icubam_host=icubam_host,
+                    restrict_to_region=restrict_to_region,
+                    cache_dir=cache_dir,
+                    store_dir=store_dir,
+                    memo=memo,
+                )
+            except Exception:
+                logging.exception("could not generate %s" % name)
+                failed.append(name)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            n_jobs, initializer=_init_render_process
+        ) as executor:
+            futures = {}
+            for name in plots:
+                logging.info("generating plot %s in %s" % (name, output_dir))
+                try:
+                    plot_data = get_plot_data(
+                        name,
+                        cached_data,
+                        api_key=api_key,
+                        icubam_host=icubam_host,
+                        restrict_to_region=restrict_to_region,
+                        cache_dir=cache_dir,
+                        store_dir=store_dir,
+                        memo=memo,
+                    )
+                except Exception:
+                    logging.exception(
+                        "could not prepare the data of %s" % name
+                    )
+                    failed.append(name)
+                    continue
+                futures[name] = executor.submit(
+                    render_plot,
+                    name,
+                    plot_data,
+                    output_dir,
+                    output_type,
+                    matplotlib_style,
+                )
+            for name, future in futures.items():
+                try:
+                    future.result()
+                except Exception:
+                    logging.exception("could not render %s" % name)
+                    failed.append(name)
+    if failed:
+        raise RuntimeError("Failed plot(s): {}".format(", ".join(failed)))
+
+
+def _memo_key(data_source, kwargs):
+    """Key of the data of `data_source` preprocessed with `kwargs`
+
+  Arguments left to their default value and arguments which do not change
+  the output (IGNORED_KWARGS) do not change the key.
+  """
+    preprocessor = PREPROCESSORS.get(data_source)
+    if preprocessor is not None:
+        parameters = inspect.signature(preprocessor).parameters
+        kwargs = {
+            **{
+                key: p.default
+                for key, p in parameters.items()
+                if p.default is not p.empty
+            },
+            **kwargs,
+        }
+    kwargs = {
+        key: value
+        for key, value in kwargs.items()
+        if key not in IGNORED_KWARGS
+    }
+    return data_source, json.dumps(kwargs, sort_keys=True, default=str)
+
+
+def _init_render_process():
+    # headless backend, whatever the backend of the parent process
+    matplotlib.use("Agg")
+
+
+def _import_plot(plot_name):
+    return __import__(f"{plot_name}", globals(), locals(), ["plot"], 1)
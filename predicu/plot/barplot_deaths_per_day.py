@@ -3,14 +3,13 @@ import numpy as np
 import seaborn as sns
 
 from predicu.data import DEPARTMENT_POPULATION
+from predicu.plot import format_dates
 
-data_source = ["bedcounts"]
+data_source = ["dept_daily_sum"]
 
 
 def plot(data):
     d = data
-    d = d.groupby(["date", "department"]).sum().reset_index()
-    d = d.sort_values(by="date")
     fig, ax = plt.subplots(1, figsize=(20, 10))
     x = d.date.values
     y = (
@@ -20,11 +19,11 @@ def plot(data):
     )
     sns.barplot(x=x, y=y, ax=ax, capsize=0.2)
     ax.axvline(6.5, c="red", alpha=0.7, ls="dotted", lw=6.0)
-    dates = np.array(sorted(data.date.unique().flatten()))
+    dates = np.sort(data.date.unique())
     xticks = np.arange(0, len(dates), 3)
     ax.set_xticks(xticks)
     ax.set_xticklabels(
-        [date.strftime("%d-%m") for date in dates[xticks]], rotation=45,
+        format_dates(dates[xticks]), rotation=45,
     )
     ax.set_ylabel("Deaths / 100,000 inhabitants")
     ax.set_xlabel(None)
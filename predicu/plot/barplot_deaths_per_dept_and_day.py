@@ -4,28 +4,14 @@ import matplotlib.patches
 import matplotlib.pyplot as plt
 import matplotlib.style
 import numpy as np
-import pandas as pd
 
-from predicu.data import BEDCOUNT_COLUMNS
-from predicu.plot import DEPARTMENT_COLOR
+from predicu.plot import DEPARTMENT_COLOR, format_dates
 
-data_source = ["bedcounts"]
+data_source = ["dept_daily_diff"]
 
 
 def plot(data):
-    data = (
-        data.groupby(["date", "department"])
-        .agg({col: "sum" for col in BEDCOUNT_COLUMNS})
-        .reset_index()
-    )
-    dfs = []
-    for department, d in data.groupby("department"):
-        d = d.sort_values(by="date")
-        d["n_covid_deaths_per_day"] = d.n_covid_deaths.diff(1).fillna(0)
-        dfs.append(d.reset_index())
-    data = pd.concat(dfs)
-
-    col = "n_covid_deaths_per_day"
+    col = "n_covid_deaths"
     sorted_depts = sorted(data.department.unique())
     fig, ax = plt.subplots(1, figsize=(8, 8))
     for i, (date, d_date) in enumerate(
@@ -49,12 +35,11 @@ def plot(data):
     ax.set_xlim(0, len(data.date.unique()))
     ax.set_xticks(np.arange(0, len(data.date.unique()), 3) + 0.5)
     ax.set_xticklabels(
-        [
-            date.strftime("%d-%m")
-            for date in np.array(sorted(data.date.unique()))[
+        format_dates(
+            np.sort(data.date.unique())[
                 np.arange(0, len(data.date.unique()), 3)
             ]
-        ],
+        ),
         rotation=45,
     )
     ax.set_ylim(0, data.groupby(["date"])[col].sum().max() + 5)
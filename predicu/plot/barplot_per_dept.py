@@ -5,17 +5,12 @@ import matplotlib.pyplot as plt
 import matplotlib.style
 import numpy as np
 
-from predicu.data import BEDCOUNT_COLUMNS
 from predicu.plot import COL_COLOR, COLUMN_TO_HUMAN_READABLE
 
-data_source = ["bedcounts"]
+data_source = ["dept_daily_sum"]
 
 
 def plot(data):
-    data = data.groupby(["date", "department"]).agg(
-        {col: "sum" for col in BEDCOUNT_COLUMNS}
-    )
-    data = data.reset_index()
     data = data.sort_values(by=["department", "date"])
     data = data.groupby("department").last()
     data = data.reset_index()
@@ -172,7 +172,9 @@ def plot_one_dep(cdep, dep_name):
     # percenBed_hopital_covid_occup = 100*zeros # dep_data.n_hospitalised_patients / unknown
     # percenBed_hopital_n_cov_occup = 100*zeros # unknown / unknown
     nicu_dep = cdep.nicu_dep.iloc[0]
-    x_days = [date.strftime("%d-%m") for date in sorted(cdep.date.unique())]
+    x_days = list(
+        pd.to_datetime(np.sort(cdep.date.unique())).strftime("%d-%m")
+    )
 
     ## filter the data that is unavailable (before march 30, approximately)
     ## instead of plotting 0s  (for numberBed_reanima_n_cov_total)
@@ -351,7 +353,7 @@ def plot_all_regions(d, bc, d_dep2reg):
                 d_dep2reg.departmentCode == dep_code
             ].departmentName.iloc[0]
             if (
-                dep_code in d.department_code_icubam.unique()
+                dep_code in d.department_code.unique()
             ):  ## check if we have the data in the database(s)
                 print(dep_name)
                 cdep = compute_all_for_plots_by_dept(d, bc, dep_name)
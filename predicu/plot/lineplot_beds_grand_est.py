@@ -1,25 +1,21 @@
-import datetime
-
 import matplotlib.pyplot as plt
 import numpy as np
 
-from predicu.plot import RANDOM_COLORS, RANDOM_MARKERS, plot_int
+from predicu.plot import RANDOM_COLORS, RANDOM_MARKERS, format_dates, plot_int
 
-data_source = ["bedcounts"]
+data_source = ["region_daily_sum"]
 
 
 def plot(data):
-    n_occ = data.groupby("date").sum()["n_covid_occ"]
-    n_free = data.groupby("date").sum()["n_covid_free"]
-    n_transfered = (
-        data.groupby("date").sum()["n_covid_transfered"].diff(1).fillna(0)
-    )
+    n_occ = data.n_covid_occ
+    n_free = data.n_covid_free
+    n_transfered = data.n_covid_transfered.diff(1).fillna(0)
     n_tot = n_occ + n_free
     n_req = n_occ + n_transfered
     fig, ax = plt.subplots(1, figsize=(18, 12))
 
     x_icubam_beg = np.argwhere(
-        np.sort(data.date.unique()) == datetime.date(2020, 3, 25)
+        np.sort(data.date.unique()) == np.datetime64("2020-03-25")
     ).flatten()[0]
     ax.axvline(x=x_icubam_beg, c="red", lw=7, ls="dashed")
     text = ax.text(
@@ -63,11 +59,11 @@ def plot(data):
     )
     ax.set_ylabel("Number of patients / beds")
     ax.legend(loc="lower right")
-    dates = np.array(sorted(data.date.unique().flatten()))
+    dates = np.sort(data.date.unique())
     xticks = np.arange(0, len(dates), 3)
     ax.set_xticks(xticks)
     ax.set_xticklabels(
-        [date.strftime("%d-%m") for date in dates[xticks]], rotation=45,
+        format_dates(dates[xticks]), rotation=45,
     )
     tikzplotlib_kwargs = dict(axis_width="13.5cm", axis_height="7.2cm",)
     return fig, tikzplotlib_kwargs
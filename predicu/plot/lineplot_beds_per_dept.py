@@ -2,16 +2,17 @@ import matplotlib.patches
 import matplotlib.pyplot as plt
 import numpy as np
 
-from predicu.data import BEDCOUNT_COLUMNS
-from predicu.plot import DEPARTMENT_COLOR, RANDOM_MARKERS, plot_int
+from predicu.plot import (
+    DEPARTMENT_COLOR,
+    RANDOM_MARKERS,
+    format_dates,
+    plot_int,
+)
 
-data_source = ["bedcounts"]
+data_source = ["dept_daily_sum"]
 
 
 def plot(data):
-    agg = {col: "sum" for col in BEDCOUNT_COLUMNS}
-    data = data.groupby(["date", "department"]).agg(agg)
-    data = data.reset_index()
     fig, ax = plt.subplots(1, figsize=(7, 4))
     for department, dg in data.groupby("department"):
         dg = dg.sort_values(by="date")
@@ -26,11 +27,11 @@ def plot(data):
             lw=2,
             marker=next(RANDOM_MARKERS),
         )
-    dates = np.array(sorted(data.date.unique().flatten()))
+    dates = np.sort(data.date.unique())
     xticks = np.arange(0, len(dates), 3)
     ax.set_xticks(xticks)
     ax.set_xticklabels(
-        [date.strftime("%d-%m") for date in dates[xticks]], rotation=45,
+        format_dates(dates[xticks]), rotation=45,
     )
     ax.legend(
         ncol=2,
@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from predicu.data import CUM_COLUMNS
-from predicu.plot import COLUMN_TO_HUMAN_READABLE
+from predicu.plot import COLUMN_TO_HUMAN_READABLE, format_dates
 
 data_source = ["bedcounts"]
 
@@ -21,11 +21,11 @@ def plot(data):
             d = d.groupby("date")[col].sum().sort_index()
             ax.plot(np.arange(d.values.shape[0]), d.values, label=g)
         ax.set_title(COLUMN_TO_HUMAN_READABLE[col])
-        dates = np.array(sorted(data.date.unique().flatten()))
+        dates = np.sort(data.date.unique())
         xticks = np.arange(0, len(dates), 3)
         ax.set_xticks(xticks)
         ax.set_xticklabels(
-            [date.strftime("%d-%m") for date in dates[xticks]], rotation=45,
+            format_dates(dates[xticks]), rotation=45,
         )
     ax0.legend(ncol=2, loc="upper left", frameon=True, fontsize="xx-small")
     fig.tight_layout()
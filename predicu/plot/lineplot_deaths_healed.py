@@ -1,21 +1,18 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
-from predicu.data import BEDCOUNT_COLUMNS
 from predicu.plot import (
     COL_COLOR,
     COLUMN_TO_HUMAN_READABLE,
     RANDOM_MARKERS,
+    format_dates,
     plot_int,
 )
 
-data_source = ["bedcounts"]
+data_source = ["region_daily_sum"]
 
 
 def plot(data):
-    agg = {col: "sum" for col in BEDCOUNT_COLUMNS}
-    data = data.groupby(["date"]).agg(agg)
-    data = data.sort_index().reset_index()
     fig, ax = plt.subplots(1, figsize=(7, 4))
     for col in ["n_covid_deaths", "n_covid_healed"]:
         plot_int(
@@ -27,11 +24,11 @@ def plot(data):
             marker=next(RANDOM_MARKERS),
             lw=2,
         )
-    dates = np.array(sorted(data.date.unique().flatten()))
+    dates = np.sort(data.date.unique())
     xticks = np.arange(0, len(dates), 3)
     ax.set_xticks(xticks)
     ax.set_xticklabels(
-        [date.strftime("%d-%m") for date in dates[xticks]], rotation=45,
+        format_dates(dates[xticks]), rotation=45,
     )
     ax.set_ylabel("Number of patients")
     ax.legend()
@@ -5,7 +5,7 @@ import matplotlib.pyplot as plt
 import matplotlib.style
 import numpy as np
 
-from predicu.plot import DEPARTMENT_COLOR, plot_int
+from predicu.plot import DEPARTMENT_COLOR, format_dates, plot_int
 
 data_source = ["combined_bedcounts_public"]
 
@@ -60,12 +60,12 @@ def plot(data):
     ax1.legend(ncol=2)
     ax2.set_ylabel("Population-normalised nb of ICU patients")
     ax2.set_title("Evolution of nb of ICU patients / 100,000 inhabitants")
-    dates = np.array(sorted(data.date.unique().flatten()))
+    dates = np.sort(data.date.unique())
     xticks = np.arange(0, len(dates), 3)
     for ax in [ax1, ax2]:
         ax.set_xticks(xticks)
         ax.set_xticklabels(
-            [date.strftime("%d-%m") for date in dates[xticks]], rotation=45,
+            format_dates(dates[xticks]), rotation=45,
         )
     ax2.legend(
         [
@@ -5,16 +5,12 @@ import matplotlib.pyplot as plt
 import matplotlib.style
 import numpy as np
 
-from predicu.data import BEDCOUNT_COLUMNS
-from predicu.plot import DEPARTMENT_COLOR, plot_int
+from predicu.plot import DEPARTMENT_COLOR, format_dates, plot_int
 
-data_source = ["bedcounts"]
+data_source = ["dept_daily_sum"]
 
 
 def plot(data):
-    agg = {col: "sum" for col in BEDCOUNT_COLUMNS}
-    data = data.groupby(["date", "department"]).agg(agg)
-    data = data.reset_index()
     data["pct_occ"] = (
         data["n_covid_occ"] / (data["n_covid_occ"] + data["n_covid_free"])
     ).fillna(0)
@@ -41,11 +37,11 @@ def plot(data):
         label="Grand Est",
         lw=4,
     )
-    dates = np.array(sorted(data.date.unique().flatten()))
+    dates = np.sort(data.date.unique())
     xticks = np.arange(0, len(dates), 3)
     ax.set_xticks(xticks)
     ax.set_xticklabels(
-        [date.strftime("%d-%m") for date in dates[xticks]], rotation=45,
+        format_dates(dates[xticks]), rotation=45,
     )
     ax.legend(
         ncol=2,
@@ -0,0 +1,58 @@
+"""Registry of the plots of predicu.plot
+
+Plot modules are parsed, not imported, so that listing the plots and the
+data they need does not import the plotting libraries. The `data_source`
+and `preprocesing_args` of a plot module must therefore be literals.
+Modules of predicu/plot whose name starts with an underscore are not plots.
+"""
+import ast
+import functools
+import os
+from typing import Dict
+
+PLOT_DIR = os.path.join(os.path.dirname(__file__), "plot")
+
+# module level variables of plot modules read by the registry, with their
+# default value (None when required)
+PLOT_VARIABLES = {"data_source": None, "preprocesing_args": {}}
+
+
+@functools.lru_cache(maxsize=None)
+def get_plots() -> Dict[str, Dict]:
+    """Plots of predicu.plot, sorted by name
+
+  Returns:
+    dict plot name -> dict of the PLOT_VARIABLES of the plot module, which
+    must not be modified
+  """
+    plots = {}
+    for path in sorted(os.listdir(PLOT_DIR)):
+        name, ext = os.path.splitext(path)
+        if ext != ".py" or name.startswith("_"):
+            continue
+        plots[name] = read_plot_variables(os.path.join(PLOT_DIR, path))
+    return plots
+
+
+def read_plot_variables(path: str) -> Dict:
+    """PLOT_VARIABLES of the plot module at `path`, without importing it"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    variables = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        if isinstance(target, ast.Name) and target.id in PLOT_VARIABLES:
+            try:
+                variables[target.id] = ast.literal_eval(node.value)
+            except ValueError:
+                raise ValueError(
+                    f"{path}: {target.id} must be a literal"
+                ) from None
+    for name, default in PLOT_VARIABLES.items():
+        if name not in variables:
+            if default is None:
+                raise ValueError(f"{path}: {name} is missing")
+            variables[name] = default
+    return variables
@@ -1,19 +1,26 @@
-import itertools
-import json
+import concurrent.futures
+import heapq
 import logging
-from typing import Optional
+import os
+from typing import Callable, Dict, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
+from predicu.cube import BedcountCube
 from predicu.data import (
     ALL_COLUMNS,
     BEDCOUNT_COLUMNS,
     CUM_COLUMNS,
-    DATA_PATHS,
+    ICU_DEPARTMENT_FIXES,
     NCUM_COLUMNS,
+    compact_dtypes,
+    dates_as_objects,
     format_data,
+    get_region_departments,
+    load_department_typo_fixes,
 )
+from predicu.profiling import run_stage
 
 SPREAD_CUM_JUMPS_MAX_JUMP = {
     "n_covid_deaths": 10,
@@ -48,7 +55,12 @@ def preprocess_bedcounts(
     max_date=None,
     restrict_to_region: Optional[str] = None,
     full: bool = True,
-) -> pd.DataFrame:
+    n_jobs: int = 1,
+    as_cube: bool = False,
+    hook: Optional[Callable[[Dict], None]] = None,
+    compact: bool = False,
+    date_as_object: bool = False,
+) -> Union[pd.DataFrame, BedcountCube]:
     """Preprocess bedcounts data
 
   Args:
@@ -56,25 +68,301 @@ def preprocess_bedcounts(
       full=False was previously done in load_icubam
       full=True was is the result of both load_icubam and load_bedcounts
       preprocessing
+    restrict_to_region : only keep the ICUs of the departments of this
+      region, see predicu.data.get_region_departments
+    n_jobs : number of processes used to aggregate the inputs of the ICUs,
+      -1 means using all the processors
+    as_cube : return a BedcountCube instead of a DataFrame (requires
+      full=True)
+    hook : called with a report of each preprocessing stage, see
+      predicu.profiling
+    compact : return compact dtypes, see predicu.data.compact_dtypes
+    date_as_object : dates are datetime.date objects instead of datetime64
+      (not supported with as_cube=True)
   """
+    if n_jobs == 0 or n_jobs < -1:
+        raise ValueError(f"n_jobs must be at least 1 or -1, got {n_jobs}")
+    if as_cube and date_as_object:
+        raise ValueError("date_as_object is not supported with as_cube")
+    d = _format_bedcounts(d, restrict_to_region, hook)
+    if not full:
+        if compact:
+            d = run_stage(hook, "compact_dtypes", compact_dtypes, d)
+        if date_as_object:
+            d = dates_as_objects(d, ["date"])
+        return d
+
+    d = run_stage(hook, "fix_mulhouse_chir", _fix_mulhouse_chir, d)
+    icu_to_first_input_date = dict(
+        d.groupby("icu_name")[["date"]].min().itertuples(name=None)
+    )
+    if n_jobs < 0:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1:
+        d = run_stage(
+            hook,
+            "aggregate_multiple_inputs",
+            aggregate_multiple_inputs,
+            d,
+            "15Min",
+        )
+        d = run_stage(
+            hook, "fill_in_missing_days", fill_in_missing_days, d, "3D"
+        )
+    else:
+        # memory allocated by the worker processes is not reported
+        d = run_stage(
+            hook,
+            "aggregate_and_fill_in",
+            _aggregate_and_fill_in_parallel,
+            d,
+            n_jobs,
+        )
+    d = _make_daily_bedcounts(
+        d, icu_to_first_input_date, spread_cum_jump_correction, max_date, hook
+    )
+    if compact:
+        d = run_stage(hook, "compact_dtypes", compact_dtypes, d)
+    if as_cube:
+        return run_stage(hook, "to_cube", BedcountCube.from_frame, d)
+    if date_as_object:
+        d = dates_as_objects(d, ["date", "datetime"])
+    return d
+
+
+def preprocess_bedcounts_incremental(
+    d,
+    state: Optional[Dict] = None,
+    spread_cum_jump_correction=False,
+    max_date=None,
+    restrict_to_region: Optional[str] = None,
+    hook: Optional[Callable[[Dict], None]] = None,
+    compact: bool = False,
+    date_as_object: bool = False,
+) -> Tuple[pd.DataFrame, Dict]:
+    """Preprocess bedcounts data, only processing inputs newer than `state`
+
+  The result is the same as the one of `preprocess_bedcounts` on all the
+  inputs seen so far, but only the inputs of `d` newer than the last
+  checkpoint are aggregated and interpolated. The daily grid is then
+  rebuilt from the compact per (icu, date) inputs kept in the state.
+
+  Args:
+    d : raw bedcounts, may contain inputs that were already processed
+    state : state returned by the previous call, None for the first call
+    hook : called with a report of each preprocessing stage, see
+      predicu.profiling
+    compact : return compact dtypes, see predicu.data.compact_dtypes
+    date_as_object : dates are datetime.date objects instead of datetime64
+
+  Returns:
+    preprocessed data and the new state, a dict with keys:
+      restrict_to_region : region of the inputs
+      last_datetime : datetime of the most recent processed input
+      last_datetime_inputs : identifiers of the processed inputs made at
+        last_datetime (rowid, or ICU name when the raw data has no rowid),
+        inputs made at that time but received later are processed by the
+        next call
+      icu_to_first_input_date : date of the first input of each ICU
+      inputs : last (at most 5) raw inputs of each ICU kept by the
+        aggregation, they are in the rolling median windows of unsettled
+        values
+      anchors : last settled aggregated value of each ICU (cumulative
+        columns are the cumulative maxima)
+      daily_inputs : last interpolated input of each (icu, date)
+  """
+    if state is None:
+        state = {
+            "restrict_to_region": restrict_to_region,
+            "last_datetime": pd.Timestamp.min,
+            "last_datetime_inputs": [],
+            "icu_to_first_input_date": {},
+            "inputs": None,
+            "anchors": None,
+            "daily_inputs": None,
+        }
+    elif state["restrict_to_region"] != restrict_to_region:
+        raise ValueError(
+            "Incremental state was built with restrict_to_region="
+            f"{state['restrict_to_region']}, got {restrict_to_region}"
+        )
+    else:
+        state = dict(state)
+        for key in ["inputs", "anchors", "daily_inputs"]:
+            if state[key] is not None and state[key].date.dtype == object:
+                # state saved when dates were datetime.date objects
+                state[key] = state[key].assign(
+                    date=pd.to_datetime(state[key].date)
+                )
+    d = d.reset_index(drop=True)
+    input_ids = d.rowid if "rowid" in d.columns else d.icu_name
+    d = _format_bedcounts(d, restrict_to_region, hook)
+    is_new = d.datetime > state["last_datetime"]
+    # states saved before last_datetime_inputs only have new inputs
+    processed = state.get("last_datetime_inputs")
+    if processed is not None:
+        at_checkpoint = d.datetime == state["last_datetime"]
+        is_new |= at_checkpoint & ~input_ids.loc[d.index].isin(processed)
+    d = d.loc[is_new]
+    d = run_stage(hook, "fix_mulhouse_chir", _fix_mulhouse_chir, d)
+    state = dict(state)
+    if len(d) > 0:
+        last_datetime = d.datetime.max()
+        last_ids = list(input_ids.loc[d.index[d.datetime == last_datetime]])
+        if last_datetime == state["last_datetime"]:
+            last_ids = list(processed) + last_ids
+        state["last_datetime"] = last_datetime
+        state["last_datetime_inputs"] = last_ids
+        icu_to_first_input_date = dict(
+            d.groupby("icu_name")[["date"]].min().itertuples(name=None)
+        )
+        icu_to_first_input_date.update(state["icu_to_first_input_date"])
+        state["icu_to_first_input_date"] = icu_to_first_input_date
+        state.update(
+            run_stage(
+                hook,
+                "update_incremental_inputs",
+                _update_incremental_inputs,
+                d,
+                state,
+            )
+        )
+    d = _make_daily_bedcounts(
+        state["daily_inputs"],
+        state["icu_to_first_input_date"],
+        spread_cum_jump_correction,
+        max_date,
+        hook,
+    )
+    if compact:
+        d = run_stage(hook, "compact_dtypes", compact_dtypes, d)
+    if date_as_object:
+        d = dates_as_objects(d, ["date", "datetime"])
+    return d, state
+
+
+def _update_incremental_inputs(d, state):
+    updated_icus = d.icu_name.unique()
+
+    def split(key):
+        frame = state[key]
+        if frame is None:
+            return None, None
+        mask = frame.icu_name.isin(updated_icus)
+        return frame.loc[mask], frame.loc[~mask]
+
+    prev_inputs, other_inputs = split("inputs")
+    anchors, other_anchors = split("anchors")
+    daily_inputs, other_daily_inputs = split("daily_inputs")
+
+    # aggregate again the inputs following the anchor of each ICU, previous
+    # inputs are kept to have complete rolling median windows
+    inputs = _drop_close_inputs(pd.concat([prev_inputs, d]), "15Min")
+    smoothed = _smooth_inputs(inputs.copy())
+    position = inputs.groupby("icu_name").cumcount().values
+    n_inputs = inputs.icu_name.map(inputs.icu_name.value_counts()).values
+    n_prev_inputs = inputs.icu_name.map(
+        {} if prev_inputs is None else prev_inputs.icu_name.value_counts()
+    )
+    anchor_position = (n_prev_inputs.fillna(0).values - 4).clip(min=-1)
+    new_anchor_position = n_inputs - 4
+    is_new_anchor = (position == new_anchor_position) & (
+        new_anchor_position > anchor_position
+    )
+    smoothed = smoothed.loc[position > anchor_position]
+    if anchors is None:
+        anchors = smoothed.iloc[:0]
+    prev_cum_max = smoothed[["icu_name"]].join(
+        anchors.set_index("icu_name")[CUM_COLUMNS], on="icu_name"
+    )
+    smoothed[CUM_COLUMNS] = np.fmax(
+        smoothed.groupby("icu_name")[CUM_COLUMNS].cummax().values,
+        prev_cum_max[CUM_COLUMNS].values,
+    ).astype(int)
+    interpolated = fill_in_missing_days(
+        pd.concat([anchors, smoothed], ignore_index=True), "3D"
+    )
+    interpolated = interpolated.drop_duplicates(
+        subset=["icu_name", "date"], keep="last"
+    )
+
+    # daily inputs from the anchor date are replaced by the new ones
+    if daily_inputs is not None:
+        anchor_dates = (
+            daily_inputs[["icu_name"]]
+            .join(anchors.set_index("icu_name").date, on="icu_name")
+            .date
+        )
+        has_anchor = anchor_dates.notna().values
+        daily_inputs = daily_inputs.loc[has_anchor]
+        daily_inputs = daily_inputs.loc[
+            (daily_inputs.date < anchor_dates.loc[has_anchor]).values
+        ]
+
+    # the 4th last aggregated value of each ICU is settled
+    new_anchors = smoothed.loc[is_new_anchor[position > anchor_position]]
+    anchors = pd.concat(
+        [
+            anchors.loc[~anchors.icu_name.isin(new_anchors.icu_name)],
+            new_anchors,
+        ]
+    )
+    return {
+        "inputs": pd.concat(
+            [other_inputs, inputs.loc[position >= n_inputs - 5]],
+            ignore_index=True,
+        ),
+        "anchors": pd.concat([other_anchors, anchors], ignore_index=True),
+        "daily_inputs": pd.concat(
+            [other_daily_inputs, daily_inputs, interpolated],
+            ignore_index=True,
+        ),
+    }
+
 
+def _format_bedcounts(d, restrict_to_region=None, hook=None):
+    d = run_stage(hook, "rename", _rename_bedcounts, d)
+    d = run_stage(hook, "fix_department_typos", _fix_department_typos, d)
     if restrict_to_region is not None:
-        if restrict_to_region == "Grand-Est":
-            region_id = 1
-            d = d.loc[d.icu_region_id == region_id]
-        else:
-            raise NotImplementedError
+        # after the department names are fixed
+        d = run_stage(
+            hook,
+            "restrict_to_region",
+            _restrict_to_region,
+            d,
+            restrict_to_region,
+        )
+    return run_stage(hook, "format_data", format_data, d)
+
+
+def _restrict_to_region(d, restrict_to_region):
+    departments = get_region_departments(restrict_to_region)
+    return d.loc[d.department.isin(departments)]
+
+
+def _rename_bedcounts(d):
+    # raw data loaded with compact dtypes
+    d = d.astype(
+        {
+            col: object
+            for col, dtype in d.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
+    )
     d = d.rename(columns={"create_date": "date", "icu_dept": "department"})
-    d.loc[d.icu_name == "St-Dizier", "department"] = "Haute-Marne"
-    with open(DATA_PATHS["department_typo_fixes"]) as f:
-        department_typo_fixes = json.load(f)
-    for wrong_name, right_name in department_typo_fixes.items():
-        d.loc[d.department == wrong_name, "department"] = right_name
+    for icu_name, department in ICU_DEPARTMENT_FIXES.items():
+        d.loc[d.icu_name == icu_name, "department"] = department
     d["region"] = d.icu_region_id
-    d = format_data(d)
-    if not full:
-        return d
+    return d
 
+
+def _fix_department_typos(d):
+    d["department"] = d.department.replace(load_department_typo_fixes())
+    return d
+
+
+def _fix_mulhouse_chir(d):
+    d = d.copy()
     d.loc[d.icu_name == "Mulhouse-Chir", "n_covid_healed"] = np.clip(
         (
             d.loc[d.icu_name == "Mulhouse-Chir", "n_covid_healed"]
@@ -83,24 +371,130 @@ def preprocess_bedcounts(
         a_min=0,
         a_max=None,
     )
-    icu_to_first_input_date = dict(
-        d.groupby("icu_name")[["date"]].min().itertuples(name=None)
-    )
+    return d
+
+
+def _aggregate_and_fill_in(d):
     d = aggregate_multiple_inputs(d, "15Min")
-    d = fill_in_missing_days(d, "3D")
-    d = enforce_daily_values_for_all_icus(d)
+    return fill_in_missing_days(d, "3D")
+
+
+def _aggregate_and_fill_in_parallel(d, n_jobs):
+    with concurrent.futures.ProcessPoolExecutor(n_jobs) as executor:
+        dfs = executor.map(_aggregate_and_fill_in, _split_icus(d, n_jobs))
+        d = pd.concat(list(dfs))
+    d = d.sort_values(by="icu_name", kind="mergesort")
+    return d.reset_index(drop=True)
+
+
+def _split_icus(d, n_chunks):
+    """Split `d` in chunks of whole ICUs with balanced numbers of inputs"""
+    chunk_loads = [(0, i) for i in range(n_chunks)]
+    icu_to_chunk = {}
+    for icu_name, n_inputs in d.icu_name.value_counts().items():
+        load, chunk = heapq.heappop(chunk_loads)
+        icu_to_chunk[icu_name] = chunk
+        heapq.heappush(chunk_loads, (load + n_inputs, chunk))
+    return [dg for _, dg in d.groupby(d.icu_name.map(icu_to_chunk))]
+
+
+def _make_daily_bedcounts(
+    d,
+    icu_to_first_input_date,
+    spread_cum_jump_correction,
+    max_date,
+    hook=None,
+):
+    d = run_stage(
+        hook,
+        "enforce_daily_values_for_all_icus",
+        enforce_daily_values_for_all_icus,
+        d,
+    )
     if spread_cum_jump_correction:
-        d = spread_cum_jumps(d, icu_to_first_input_date)
+        d = run_stage(
+            hook,
+            "spread_cum_jumps",
+            spread_cum_jumps,
+            d,
+            icu_to_first_input_date,
+        )
+    return run_stage(hook, "sort_and_filter", _sort_and_filter, d, max_date)
+
+
+def _sort_and_filter(d, max_date):
     d = d[ALL_COLUMNS]
     d = d.sort_values(by=["date", "icu_name"])
 
     if max_date is not None:
         logging.info("data loaded's max date will be %s (excluded)" % max_date)
-        d = d.loc[d.date < pd.to_datetime(max_date).date()]
+        d = d.loc[d.date < pd.Timestamp(max_date)]
     return d
 
 
-def aggregate_multiple_inputs(d, agg_time_delta="15Min"):
+def aggregate_multiple_inputs(
+    d, agg_time_delta="15Min", engine="vectorized"
+):
+    """Aggregate multiple inputs of the same ICU into smoothed values
+
+  Inputs made less than `agg_time_delta` before the next one are dropped,
+  rolling medians are applied and cumulative columns are made non-decreasing.
+
+  Args:
+    d : formatted bedcounts DataFrame
+    agg_time_delta : inputs closer than this are deduplicated
+    engine : "vectorized" processes all ICUs in one grouped pass, "loop"
+      iterates over ICUs and rows (reference implementation)
+  """
+    if engine == "vectorized":
+        return _aggregate_multiple_inputs_vectorized(d, agg_time_delta)
+    elif engine == "loop":
+        return _aggregate_multiple_inputs_loop(d, agg_time_delta)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+
+def _aggregate_multiple_inputs_vectorized(d, agg_time_delta="15Min"):
+    d = _smooth_inputs(_drop_close_inputs(d, agg_time_delta))
+
+    # si la valeur decroit dans une colonne cumulative, alors on redresse ne
+    # appliquant la valeur precedente
+    d[CUM_COLUMNS] = d.groupby("icu_name")[CUM_COLUMNS].cummax()
+
+    d.index = d.groupby("icu_name").cumcount().values
+    return d[["datetime"] + [col for col in d.columns if col != "datetime"]]
+
+
+def _drop_close_inputs(d, agg_time_delta):
+    """Drop the inputs followed by another one within agg_time_delta"""
+    d = d.loc[d.icu_name.notna()]
+    d = d.sort_values(by=["icu_name", "datetime"], kind="mergesort")
+    d = d.reset_index(drop=True)
+    next_datetime = d.groupby("icu_name").datetime.shift(-1)
+    mask = (next_datetime - d.datetime > pd.Timedelta(agg_time_delta)) | (
+        next_datetime.isna()
+    )
+    return d.loc[mask.values].reset_index(drop=True)
+
+
+def _smooth_inputs(d):
+    """Rolling medians per ICU, `d` must be sorted by ICU and datetime"""
+    d[NCUM_COLUMNS] = d[NCUM_COLUMNS].fillna(0)
+
+    # rolling median average, 5 points (for cumulative qtities) and 3 points
+    # (for non-cumulative qtities)
+    for cols, window in ((CUM_COLUMNS, 5), (NCUM_COLUMNS, 3)):
+        medians = (
+            d.groupby("icu_name")[cols]
+            .rolling(window, center=True, min_periods=1)
+            .median()
+            .reset_index(level=0, drop=True)
+        )
+        d[cols] = medians.astype(int)
+    return d
+
+
+def _aggregate_multiple_inputs_loop(d, agg_time_delta="15Min"):
     res_dfs = []
     for icu_name, dg in d.groupby("icu_name"):
         dg = dg.set_index("datetime")
@@ -148,201 +542,157 @@ def aggregate_multiple_inputs(d, agg_time_delta="15Min"):
 
 
 def fill_in_missing_days(d, time_delta_threshold="3D"):
-    res_dfs = []
+    """Add linearly interpolated daily inputs in gaps between inputs
 
-    for icu_name, dg in d.groupby("icu_name"):
-        dg = dg.sort_values(by=["datetime"])
-        time_delta = dg["datetime"].diff(1)
-        for i, td in enumerate(time_delta):
-            if td > pd.Timedelta(time_delta_threshold):
-                n_days = td // pd.Timedelta("1D")
-                val_init = dg.iloc[i - 1]
-                val_final = dg.iloc[i]
-                for added_day in range(n_days):
-                    added_datetime = (
-                        val_init.datetime + pd.Timedelta("1D") * added_day
-                    )
-                    added_date = val_init.date + pd.Timedelta("1D") * added_day
-                    new_row = {
-                        "datetime": added_datetime,
-                        "icu_name": val_init.icu_name,
-                        "date": added_date,
-                        "department": val_init.department,
-                        "n_covid_deaths": np.round(
-                            val_init.n_covid_deaths
-                            + (
-                                val_final.n_covid_deaths
-                                - val_init.n_covid_deaths
-                            )
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                        "n_covid_healed": np.round(
-                            val_init.n_covid_healed
-                            + (
-                                val_final.n_covid_healed
-                                - val_init.n_covid_healed
-                            )
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                        "n_covid_transfered": np.round(
-                            val_init.n_covid_transfered
-                            + (
-                                val_final.n_covid_transfered
-                                - val_init.n_covid_transfered
-                            )
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                        "n_covid_refused": np.round(
-                            val_init.n_covid_refused
-                            + (
-                                val_final.n_covid_refused
-                                - val_init.n_covid_refused
-                            )
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                        "n_covid_free": np.round(
-                            val_init.n_covid_free
-                            + (val_final.n_covid_free - val_init.n_covid_free)
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                        "n_ncovid_free": np.round(
-                            val_init.n_ncovid_free
-                            + (
-                                val_final.n_ncovid_free
-                                - val_init.n_ncovid_free
-                            )
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                        "n_covid_occ": np.round(
-                            val_init.n_covid_occ
-                            + (val_final.n_covid_occ - val_init.n_covid_occ)
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                        "n_ncovid_occ": np.round(
-                            val_init.n_ncovid_occ
-                            + (val_final.n_ncovid_occ - val_init.n_ncovid_occ)
-                            * added_day
-                            * 1.0
-                            / n_days,
-                            4,
-                        ),
-                    }
-                    dg = dg.append(pd.Series(new_row), ignore_index=True)
-        dg = dg.sort_values(by=["datetime"])
-        res_dfs.append(dg)
-    return pd.concat(res_dfs)
+  For every ICU, gaps longer than `time_delta_threshold` between two
+  consecutive inputs are filled with one input per day, the values of all
+  BEDCOUNT_COLUMNS being interpolated between the inputs around the gap.
+  """
+    d = d.sort_values(by=["icu_name", "datetime"], kind="mergesort")
+    d = d.reset_index(drop=True)
+    time_delta = d.groupby("icu_name").datetime.diff(1)
+    gap_ends = np.flatnonzero(
+        (time_delta > pd.Timedelta(time_delta_threshold)).values
+    )
+    if len(gap_ends) == 0:
+        return d
+
+    # one added row per missing day, starting from the input before the gap
+    n_days = (time_delta.iloc[gap_ends] // pd.Timedelta("1D")).values
+    n_days = n_days.astype(int)
+    gap_begins = np.repeat(gap_ends - 1, n_days)
+    added_days = np.arange(n_days.sum()) - np.repeat(
+        np.cumsum(n_days) - n_days, n_days
+    )
+    weights = (added_days * 1.0 / np.repeat(n_days, n_days))[:, None]
+    values = d[BEDCOUNT_COLUMNS].to_numpy(dtype=float)
+    val_init = values[gap_begins]
+    val_final = values[np.repeat(gap_ends, n_days)]
+
+    added = d.iloc[gap_begins].reset_index(drop=True)
+    added["datetime"] = added.datetime + pd.to_timedelta(added_days, unit="D")
+    added["date"] = added.datetime.dt.normalize()
+    added[BEDCOUNT_COLUMNS] = np.round(
+        val_init + (val_final - val_init) * weights, 4
+    )
+    d = pd.concat([d, added], ignore_index=True)
+    d = d.sort_values(by=["icu_name", "datetime"], kind="mergesort")
+    return d.reset_index(drop=True)
 
 
 def enforce_daily_values_for_all_icus(d):
-    dates = sorted(list(d.date.unique()))
-    icu_names = sorted(list(d.icu_name.unique()))
-    new_data_points = list()
-    per_icu_prev_data_point = dict()
-    icu_name_to_dept = dict(
-        d.groupby(["icu_name", "department"])
-        .first()
-        .reset_index()[["icu_name", "department"]]
-        .itertuples(name=None, index=False)
+    """Build one data point per date and per ICU
+
+  The value of an ICU at a given date is its last input of that date, or the
+  value of the previous date if there is no input that day (0 before its
+  first input). Each ICU keeps its department and region for all dates.
+  """
+    dates = np.sort(d.date.unique())
+    icu_names = np.sort(d.icu_name.unique())
+    icu_attributes = d.groupby("icu_name")[["department", "region"]].max()
+
+    # last input per (icu, date)
+    d = d.sort_values(by=["icu_name", "date", "datetime"], kind="mergesort")
+    d = d.drop_duplicates(subset=["icu_name", "date"], keep="last")
+
+    # position of the last known input of each (icu, date) of the full grid
+    grid = pd.MultiIndex.from_product(
+        [icu_names, dates], names=["icu_name", "date"]
     )
-    icu_name_to_region = dict(
-        d.groupby(["icu_name", "region"])
-        .first()
-        .reset_index()[["icu_name", "region"]]
-        .itertuples(name=None, index=False)
+    positions = pd.Series(
+        np.arange(len(d)),
+        index=pd.MultiIndex.from_arrays([d.icu_name, d.date]),
     )
-    for date, icu_name in itertools.product(dates, icu_names):
-        sd = d.loc[(d.date == date) & (d.icu_name == icu_name)]
-        sd = sd.sort_values(by="datetime")
-        new_data_point = {
-            "date": date,
-            "icu_name": icu_name,
-            "department": icu_name_to_dept[icu_name],
-            "region": icu_name_to_region[icu_name],
-            "datetime": date,
+    positions = positions.reindex(grid).groupby(level="icu_name").ffill()
+    known = positions.notna().values
+    positions = positions.fillna(0).values.astype(int)
+
+    values = d[BEDCOUNT_COLUMNS].values[positions]
+    values = np.where(known[:, None], values, 0)
+    # the grid is (icu, date) ordered, the result is (date, icu) ordered
+    values = values.reshape(len(icu_names), len(dates), -1)
+    values = values.transpose(1, 0, 2).reshape(-1, len(BEDCOUNT_COLUMNS))
+
+    res = pd.DataFrame(
+        {
+            "date": np.repeat(dates, len(icu_names)),
+            "icu_name": np.tile(icu_names, len(dates)),
         }
-        new_data_point.update({col: 0 for col in CUM_COLUMNS})
-        new_data_point.update({col: 0 for col in NCUM_COLUMNS})
-        if icu_name in per_icu_prev_data_point:
-            new_data_point.update(
-                {
-                    col: per_icu_prev_data_point[icu_name][col]
-                    for col in BEDCOUNT_COLUMNS
-                }
-            )
-        if len(sd) > 0:
-            new_data_point.update(
-                {col: sd[col].iloc[-1] for col in BEDCOUNT_COLUMNS}
-            )
-        per_icu_prev_data_point[icu_name] = new_data_point
-        new_data_points.append(new_data_point)
-    return pd.DataFrame(new_data_points)
+    )
+    res = res.join(icu_attributes, on="icu_name")
+    res["datetime"] = res.date
+    for i, col in enumerate(BEDCOUNT_COLUMNS):
+        res[col] = values[:, i]
+    return res
 
 
 def spread_cum_jumps(d, icu_to_first_input_date):
+    """Spread jumps of cumulative values around switch points
+
+  A cumulative value that jumps around the first input of an ICU (or around
+  the date when transfers and refusals started being collected) is replaced
+  by a linear ramp from the first date. All ICUs and columns are processed
+  at once, `d` must contain one data point per date and per ICU.
+  """
     assert np.all(d.date.values == d.datetime.values)
-    date_begin_transfered_refused = pd.to_datetime("2020-03-25").date()
-    dfs = []
-    for icu_name, dg in d.groupby("icu_name"):
-        dg = dg.sort_values(by="date")
-        dg = dg.reset_index()
-        already_fixed_col = set()
-        for switch_point, cols in (
-            (icu_to_first_input_date[icu_name], CUM_COLUMNS),
-            (
-                date_begin_transfered_refused,
-                ["n_covid_transfered", "n_covid_refused"],
-            ),
-        ):
-            beg = max(dg.date.min(), switch_point - pd.Timedelta("2D"),)
-            end = min(dg.date.max(), switch_point + pd.Timedelta("2D"),)
-            for col in cols:
-                if col in already_fixed_col:
-                    continue
-                beg_val = dg.loc[dg.date == beg, col].values[0]
-                end_val = dg.loc[dg.date == end, col].values[0]
-                diff = end_val - beg_val
-                if diff >= SPREAD_CUM_JUMPS_MAX_JUMP[col]:
-                    spread_beg = dg.date.min()
-                    spread_end = end
-                    spread_range = pd.date_range(
-                        spread_beg, spread_end, freq="1D"
-                    ).date
-                    spread_value = diff // (spread_end - spread_beg).days
-                    remaining = diff % (spread_end - spread_beg).days
-                    dg.loc[dg.date.isin(spread_range), col] = np.clip(
-                        np.cumsum(np.repeat(spread_value, len(spread_range))),
-                        a_min=0,
-                        a_max=end_val,
-                    )
-                    dg.loc[dg.date == end, col] = np.clip(
-                        dg.loc[dg.date == end, col].values[0] + remaining,
-                        a_min=0,
-                        a_max=end_val,
-                    )
-                    already_fixed_col.add(col)
-        dfs.append(dg)
-    return pd.concat(dfs)
+    date_begin_transfered_refused = pd.to_datetime("2020-03-25")
+    d = d.sort_values(by=["icu_name", "date"], kind="mergesort")
+    d = d.reset_index(drop=True)
+    icu_names = d.icu_name.unique()
+    dates = pd.to_datetime(np.sort(d.date.unique()))
+    n_icus, n_dates = len(icu_names), len(dates)
+    assert len(d) == n_icus * n_dates
+
+    # days since the first date, some days may have no data
+    day_offsets = (dates - dates[0]).days.values
+
+    def to_date_index(switch_point):
+        """Positions in `dates` of the first and last dates of the 5 days
+      around `switch_point`"""
+        day = (pd.DatetimeIndex(switch_point) - dates[0]).days.values
+        beg = np.searchsorted(day_offsets, day - 2, side="left")
+        end = np.searchsorted(day_offsets, day + 2, side="right") - 1
+        beg = np.clip(beg, 0, n_dates - 1)
+        end = np.clip(end, beg, n_dates - 1)
+        return beg, end
+
+    first_input_switch_point = to_date_index(
+        pd.to_datetime([icu_to_first_input_date[name] for name in icu_names])
+    )
+    transfered_refused_switch_point = to_date_index(
+        np.repeat(date_begin_transfered_refused, n_icus)
+    )
+    icus = np.arange(n_icus)
+    for col in CUM_COLUMNS:
+        switch_points = [first_input_switch_point]
+        if col in ["n_covid_transfered", "n_covid_refused"]:
+            switch_points.append(transfered_refused_switch_point)
+        values = d[col].values.reshape(n_icus, n_dates)
+        already_fixed = np.zeros(n_icus, dtype=bool)
+        for beg, end in switch_points:
+            beg_val = values[icus, beg]
+            end_val = values[icus, end]
+            diff = end_val - beg_val
+            fixed = ~already_fixed & (diff >= SPREAD_CUM_JUMPS_MAX_JUMP[col])
+            # the ramp goes from the first date to the end of the switch point
+            n_days = np.maximum(day_offsets[end], 1)
+            spread_value = diff // n_days
+            remaining = diff % n_days
+            ramp = np.clip(
+                spread_value[:, None] * (day_offsets[None, :] + 1),
+                a_min=0,
+                a_max=end_val[:, None],
+            )
+            ramp[icus, end] = np.clip(
+                ramp[icus, end] + remaining, a_min=0, a_max=end_val
+            )
+            in_ramp = fixed[:, None] & (
+                np.arange(n_dates)[None, :] <= end[:, None]
+            )
+            values = np.where(in_ramp, ramp, values)
+            already_fixed |= fixed
+        d[col] = values.reshape(-1).astype(d[col].dtype)
+    return d
 
 
 PREPROCESSORS = {"bedcounts": preprocess_bedcounts}
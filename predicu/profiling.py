@@ -0,0 +1,84 @@
+"""Per-stage instrumentation of the preprocessing
+
+Preprocessing functions accept a `hook` argument, called after each stage
+with a dict describing it:
+
+  stage : name of the stage
+  wall_time : duration of the stage in seconds
+  rows_in, rows_out : number of rows of the input and output DataFrames
+  peak_memory : peak memory allocated during the stage in bytes, above the
+    memory allocated when it started (measured with tracemalloc)
+
+For instance, to collect a report alongside the preprocessed data:
+
+  report = []
+  d = preprocess_bedcounts(d, hook=report.append)
+  print(format_report(report))
+
+Without hook, stages are plain function calls.
+"""
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+
+def run_stage(
+    hook: Optional[Callable[[Dict], None]], stage: str, func, d, *args
+):
+    """Return func(d, *args), reporting the stage to `hook` if not None
+
+  Stages must not be nested, the peak memory of the outer stage would be
+  wrong.
+  """
+    if hook is None:
+        return func(d, *args)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    if hasattr(tracemalloc, "reset_peak"):  # Python >= 3.9
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        res = func(d, *args)
+    finally:
+        wall_time = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+    hook(
+        {
+            "stage": stage,
+            "wall_time": wall_time,
+            "rows_in": _n_rows(d),
+            "rows_out": _n_rows(res),
+            "peak_memory": max(peak_memory - start_memory, 0),
+        }
+    )
+    return res
+
+
+def format_report(report: List[Dict]) -> str:
+    """Format the stages reported to a hook as a table"""
+    lines = [
+        f"{'stage':<36}{'time (s)':>10}{'rows in':>10}{'rows out':>10}"
+        f"{'peak (MiB)':>12}"
+    ]
+    for r in report:
+        lines.append(
+            f"{r['stage']:<36}{r['wall_time']:>10.4f}"
+            f"{_format_rows(r['rows_in']):>10}"
+            f"{_format_rows(r['rows_out']):>10}"
+            f"{r['peak_memory'] / 1024 ** 2:>12.2f}"
+        )
+    total_time = sum(r["wall_time"] for r in report)
+    lines.append(f"{'total':<36}{total_time:>10.4f}")
+    return "\n".join(lines)
+
+
+def _n_rows(d):
+    return len(d) if hasattr(d, "__len__") else None
+
+
+def _format_rows(n_rows):
+    return "-" if n_rows is None else str(n_rows)
@@ -0,0 +1,176 @@
+"""Columnar store of raw data
+
+A source is stored in a directory with one Arrow IPC (Feather v2) file per
+month of its date column. Files are read through memory maps, so processes
+reading the same store share its pages through the OS page cache instead of
+each parsing CSV, and only the months, columns and rows asked for are
+converted to pandas. Requires pyarrow.
+"""
+import datetime
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+META_FILENAME = "meta.json"
+
+
+def store_age(path: str) -> Optional[float]:
+    """Seconds since the store at `path` was written, None if missing"""
+    meta_path = Path(path) / META_FILENAME
+    if not meta_path.is_file():
+        return None
+    with open(meta_path) as f:
+        return time.time() - json.load(f)["updated"]
+
+
+def write_store(path: str, d: pd.DataFrame, date_column: str):
+    """Write `d` to the store at `path`, partitioned by month
+
+  Partitions whose content did not change are not rewritten, and files are
+  replaced atomically so that concurrent readers see either the old or the
+  new data.
+  """
+    import pyarrow as pa
+    import pyarrow.feather
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    meta = _read_meta(path)
+    d = d.reset_index(drop=True)
+    # datetime.date objects are converted back when reading
+    first_date = d[date_column].dropna().iloc[:1].tolist()
+    date_as_object = bool(first_date) and type(first_date[0]) is datetime.date
+    d[date_column] = pd.to_datetime(d[date_column])
+    # the same schema for all the partitions, even if a column only contains
+    # missing values in some of them
+    schema = pa.Schema.from_pandas(d, preserve_index=False)
+    partitions = {}
+    for month, part in d.groupby(d[date_column].dt.strftime("%Y-%m")):
+        part_hash = str(pd.util.hash_pandas_object(part, index=False).sum())
+        partitions[month] = part_hash
+        part_path = path / f"{month}.arrow"
+        if meta["partitions"].get(month) == part_hash and part_path.exists():
+            continue
+        tmp_path = path / f"{month}.arrow.{os.getpid()}.tmp"
+        table = pa.Table.from_pandas(
+            part, schema=schema, preserve_index=False
+        )
+        # uncompressed files can be memory mapped without copies
+        pyarrow.feather.write_feather(
+            table, tmp_path, compression="uncompressed"
+        )
+        os.replace(tmp_path, part_path)
+    for month in set(meta["partitions"]) - set(partitions):
+        (path / f"{month}.arrow").unlink()
+    meta = {
+        "date_column": date_column,
+        "date_as_object": date_as_object,
+        "partitions": partitions,
+        "updated": time.time(),
+    }
+    tmp_path = path / f"{META_FILENAME}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path / META_FILENAME)
+
+
+def read_store(
+    path: str,
+    columns: Optional[List[str]] = None,
+    min_date=None,
+    max_date=None,
+    filters: Optional[Dict] = None,
+) -> pd.DataFrame:
+    """Read the store at `path`
+
+  Args:
+    columns : columns to read, all by default
+    min_date, max_date : only rows with min_date <= date < max_date are read
+    filters : only rows whose value in column `col` is in `filters[col]` are
+      read. A key can also be a tuple of columns, with a tuple of lists of
+      values: rows whose value in any of these columns is in the matching
+      list are read.
+  """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    path = Path(path)
+    meta = _read_meta(path)
+    date_column = meta["date_column"]
+    filters = dict(filters or {})
+    filter_columns = [
+        c
+        for col in filters
+        for c in (col if isinstance(col, tuple) else [col])
+    ]
+    min_date = None if min_date is None else pd.Timestamp(min_date)
+    max_date = None if max_date is None else pd.Timestamp(max_date)
+    months = sorted(meta["partitions"])
+    if not months:
+        raise ValueError(f"no data in {path}")
+    selected_months = [
+        month
+        for month in months
+        if (max_date is None or pd.Timestamp(month) < max_date)
+        and (
+            min_date is None
+            or pd.Timestamp(month) + pd.offsets.MonthBegin(1) > min_date
+        )
+    ]
+    tables = []
+    for month in selected_months or months[:1]:
+        with pa.memory_map(str(path / f"{month}.arrow")) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(
+                list(dict.fromkeys(columns + [date_column] + filter_columns))
+            )
+        mask = None
+        for op, date in [(pc.greater_equal, min_date), (pc.less, max_date)]:
+            if date is not None:
+                date = pa.scalar(date, type=table[date_column].type)
+                mask = _and(mask, op(table[date_column], date))
+        for col, values in filters.items():
+            if not isinstance(col, tuple):
+                col, values = (col,), (values,)
+            any_mask = None
+            for c, v in zip(col, values):
+                value_set = pa.array(list(v), type=table[c].type)
+                is_in = pc.is_in(table[c], value_set=value_set)
+                any_mask = _or(any_mask, is_in)
+            mask = _and(mask, any_mask)
+        if mask is not None:
+            table = table.filter(mask)
+        if not selected_months:
+            table = table.slice(0, 0)
+        tables.append(table)
+    d = pa.concat_tables(tables).to_pandas()
+    if meta["date_as_object"]:
+        d[date_column] = d[date_column].dt.date
+    if columns is not None:
+        d = d[columns]
+    return d
+
+
+def _and(mask, other):
+    import pyarrow.compute as pc
+
+    return other if mask is None else pc.and_(mask, other)
+
+
+def _or(mask, other):
+    import pyarrow.compute as pc
+
+    return other if mask is None else pc.or_(mask, other)
+
+
+def _read_meta(path):
+    meta_path = path / META_FILENAME
+    if not meta_path.is_file():
+        return {"partitions": {}}
+    with open(meta_path) as f:
+        return json.load(f)
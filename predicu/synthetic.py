@@ -0,0 +1,224 @@
+"""Synthetic ICUBAM and public data, for tests and benchmarks"""
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from predicu.data import load_department_typo_fixes, load_france_departments
+
+# columns of the ICUBAM all_bedcounts CSV export
+ICUBAM_BEDCOUNTS_COLUMNS = [
+    "rowid",
+    "icu_id",
+    "n_covid_occ",
+    "n_covid_free",
+    "n_ncovid_occ",
+    "n_ncovid_free",
+    "n_covid_deaths",
+    "n_covid_healed",
+    "n_covid_refused",
+    "n_covid_transfered",
+    "message",
+    "create_date",
+    "last_modified",
+    "icu_icu_id",
+    "icu_region_id",
+    "icu_name",
+    "icu_dept",
+    "icu_city",
+    "icu_country",
+    "icu_lat",
+    "icu_long",
+    "icu_telephone",
+    "icu_is_active",
+    "icu_create_date",
+    "icu_last_modified",
+    "icu_bed_counts",
+    "icu_users",
+    "icu_managers",
+]
+# columns of the data.gouv.fr hospital data CSV
+PUBLIC_COLUMNS = ["dep", "sexe", "jour", "hosp", "rea", "rad", "dc"]
+# ICUBAM region id of Grand-Est, see preprocess_bedcounts
+GRAND_EST_REGION_CODE = 44
+GRAND_EST_REGION_ID = 1
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def generate_bedcounts(
+    n_icus: int = 20,
+    n_days: int = 30,
+    inputs_per_day: float = 3.0,
+    departments: Optional[List[str]] = None,
+    start_date: str = "2020-03-15",
+    seed: int = 0,
+    gap_probability: float = 0.01,
+    decrease_probability: float = 0.03,
+    typo_probability: float = 0.02,
+) -> pd.DataFrame:
+    """Random bedcounts with the columns of the ICUBAM all_bedcounts export
+
+  ICUs are spread over `departments` (all the departments by default) and
+  start entering data at random dates. Each ICU makes on average
+  `inputs_per_day` inputs per day, some of them corrected a few minutes
+  later. Inputs may stop for several days, cumulative values sometimes
+  decrease and department names sometimes contain typos.
+
+  Args:
+    n_icus : number of ICUs
+    n_days : number of days of data
+    inputs_per_day : average number of inputs per ICU and per day
+    departments : departments of the ICUs
+    seed : seed of the random number generator
+    gap_probability : probability for an ICU to stop inputs on a given day,
+      for 3 to 8 days
+    decrease_probability : probability of an input to have lower
+      cumulative values than the previous one
+    typo_probability : probability of a department name to have a typo
+  """
+    rng = np.random.RandomState(seed)
+    dpts = load_france_departments().dropna(subset=["regionCode"])
+    dpts = dpts.set_index("departmentName")
+    if departments is None:
+        departments = list(dpts.index)
+    department_typos = {
+        right_name: wrong_name
+        for wrong_name, right_name in load_department_typo_fixes().items()
+    }
+    start_date = pd.Timestamp(start_date)
+    dfs = []
+    for icu_id in range(1, n_icus + 1):
+        department = departments[rng.randint(len(departments))]
+        first_day = rng.randint(n_days // 4 + 1)
+        if rng.rand() < 0.1:
+            first_day = rng.randint(n_days)
+        n_inputs_per_day = rng.poisson(inputs_per_day, n_days)
+        n_inputs_per_day[:first_day] = 0
+        for day in np.flatnonzero(rng.rand(n_days) < gap_probability):
+            n_inputs_per_day[day : day + rng.randint(3, 9)] = 0
+        n_inputs_per_day[first_day] += 1
+        day = np.repeat(np.arange(n_days), n_inputs_per_day)
+        minute = np.sort(day * 24 * 60 + rng.randint(24 * 60, size=len(day)))
+        # inputs corrected a few minutes later
+        corrected = rng.rand(len(minute)) < 0.1
+        minute = np.sort(
+            np.concatenate([minute, minute[corrected] + rng.randint(1, 10)])
+        )
+        n = len(minute)
+        days_since_first = (minute - first_day * 24 * 60) / (24 * 60)
+
+        capacity = rng.randint(5, 60)
+        rate = capacity / 20
+        cum = np.stack(
+            [
+                rng.poisson(rate * np.maximum(days_since_first, 0.0) * p)
+                for p in [0.3, 0.6, 0.1, 0.1]
+            ],
+            axis=1,
+        )
+        cum = np.maximum.accumulate(cum, axis=0)
+        decreasing = rng.rand(n) < decrease_probability
+        cum[decreasing] -= rng.randint(1, 5, size=(decreasing.sum(), 1))
+        cum = np.clip(cum, 0, None)
+        n_covid_occ = np.clip(
+            np.round(
+                capacity * 0.6
+                + np.cumsum(rng.normal(0, capacity / 20, size=n))
+            ),
+            0,
+            capacity,
+        ).astype(int)
+        n_ncovid_occ = rng.randint(0, capacity // 2 + 1, size=n).astype(float)
+        n_ncovid_occ[rng.rand(n) < 0.1] = np.nan
+        icu_dept = np.repeat(department, n).astype(object)
+        if department in department_typos:
+            typo = rng.rand(n) < typo_probability
+            icu_dept[typo] = department_typos[department]
+
+        create_date = pd.to_datetime(minute, unit="m", origin=start_date)
+        create_date = create_date.strftime(DATE_FORMAT)
+        region_code = dpts.loc[department, "regionCode"]
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "icu_id": icu_id,
+                    "n_covid_occ": n_covid_occ,
+                    "n_covid_free": capacity - n_covid_occ,
+                    "n_ncovid_occ": n_ncovid_occ,
+                    "n_ncovid_free": rng.randint(0, 10, size=n),
+                    "n_covid_deaths": cum[:, 0],
+                    "n_covid_healed": cum[:, 1],
+                    "n_covid_refused": cum[:, 2],
+                    "n_covid_transfered": cum[:, 3],
+                    "message": np.nan,
+                    "create_date": create_date,
+                    "last_modified": create_date,
+                    "icu_icu_id": icu_id,
+                    "icu_region_id": (
+                        GRAND_EST_REGION_ID
+                        if int(region_code) == GRAND_EST_REGION_CODE
+                        else int(region_code)
+                    ),
+                    "icu_name": f"ICU{icu_id:04d}",
+                    "icu_dept": icu_dept,
+                    "icu_city": "Unknown",
+                    "icu_country": np.nan,
+                    "icu_lat": rng.uniform(42, 51),
+                    "icu_long": rng.uniform(-4, 8),
+                    "icu_telephone": "test_tel",
+                    "icu_is_active": True,
+                    "icu_create_date": create_date[0],
+                    "icu_last_modified": create_date[0],
+                    "icu_bed_counts": "[]",
+                    "icu_users": "[]",
+                    "icu_managers": "[]",
+                }
+            )
+        )
+    d = pd.concat(dfs, ignore_index=True)
+    d = d.sort_values(by=["create_date", "icu_id"], kind="mergesort")
+    d["rowid"] = np.arange(1, len(d) + 1)
+    return d[ICUBAM_BEDCOUNTS_COLUMNS].reset_index(drop=True)
+
+
+def generate_public(
+    n_days: int = 30,
+    departments: Optional[List[str]] = None,
+    start_date: str = "2020-03-15",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Random hospital data with the columns of the data.gouv.fr CSV
+
+  There is one row per department, day and sex (0 for both sexes, 1 and 2
+  otherwise).
+  """
+    rng = np.random.RandomState(seed)
+    dpts = load_france_departments().dropna(subset=["regionCode"])
+    if departments is not None:
+        dpts = dpts.loc[dpts.departmentName.isin(departments)]
+    dates = pd.date_range(start_date, periods=n_days, freq="D")
+    n = len(dpts) * n_days
+    dfs = []
+    for sexe, fraction in [(1, 0.6), (2, 0.4)]:
+        size = rng.randint(50, 500, size=(len(dpts), 1))
+        rea = np.cumsum(rng.poisson(size / 50, size=(len(dpts), n_days)), 1)
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "dep": np.repeat(dpts.departmentCode.values, n_days),
+                    "sexe": sexe,
+                    "jour": np.tile(dates.strftime("%Y-%m-%d"), len(dpts)),
+                    "hosp": (rea * 3 * fraction).astype(int).reshape(n),
+                    "rea": (rea * fraction).astype(int).reshape(n),
+                    "rad": (rea * 2 * fraction).astype(int).reshape(n),
+                    "dc": (rea * 0.5 * fraction).astype(int).reshape(n),
+                }
+            )
+        )
+    both = dfs[0].copy()
+    both["sexe"] = 0
+    for col in ["hosp", "rea", "rad", "dc"]:
+        both[col] = dfs[0][col] + dfs[1][col]
+    d = pd.concat([both] + dfs, ignore_index=True)
+    d = d.sort_values(by=["dep", "jour", "sexe"], kind="mergesort")
+    return d[PUBLIC_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,65 @@
+import os
+import time
+
+import pandas as pd
+
+import predicu.cache
+from predicu.cache import cached_preprocess_data, evict
+from predicu.preprocessing import preprocess_bedcounts
+from predicu.tests.utils import make_raw_bedcounts
+
+
+def test_cached_preprocess_data(tmpdir, monkeypatch):
+    raw = make_raw_bedcounts()
+    expected = preprocess_bedcounts(raw)
+    d = cached_preprocess_data("bedcounts", raw, cache_dir=str(tmpdir))
+    pd.testing.assert_frame_equal(d, expected)
+    assert len(os.listdir(tmpdir / "preprocessed")) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cache miss")
+
+    monkeypatch.setattr(predicu.cache, "preprocess_data", fail)
+    d = cached_preprocess_data(
+        "bedcounts", raw, cache_dir=str(tmpdir), n_jobs=2
+    )
+    pd.testing.assert_frame_equal(d, expected)
+    monkeypatch.undo()
+
+    # other arguments or other data are other entries
+    cached_preprocess_data(
+        "bedcounts", raw, cache_dir=str(tmpdir), max_date="2020-03-25"
+    )
+    cached_preprocess_data("bedcounts", raw.iloc[1:], cache_dir=str(tmpdir))
+    assert len(os.listdir(tmpdir / "preprocessed")) == 3
+
+    # data without preprocessing is not cached
+    public = pd.DataFrame({"n_icu_patients": [1, 2]})
+    d = cached_preprocess_data("public", public, cache_dir=str(tmpdir))
+    assert d is public
+    assert len(os.listdir(tmpdir / "preprocessed")) == 3
+
+
+def test_evict(tmpdir):
+    now = time.time()
+    for i in range(5):
+        path = tmpdir / f"{i}.pickle"
+        path.write(b"0" * 100)
+        os.utime(path, (now - i * 100, now - i * 100))
+    # written by another process
+    tmp_path = tmpdir / "5.pickle.1234.tmp"
+    tmp_path.write(b"0" * 100)
+    os.utime(tmp_path, (now - 1000, now - 1000))
+    evict(tmpdir, max_age=250)
+    assert sorted(os.listdir(tmpdir)) == [
+        "0.pickle",
+        "1.pickle",
+        "2.pickle",
+        "5.pickle.1234.tmp",
+    ]
+    evict(tmpdir, max_size=250)
+    assert sorted(os.listdir(tmpdir)) == [
+        "0.pickle",
+        "1.pickle",
+        "5.pickle.1234.tmp",
+    ]
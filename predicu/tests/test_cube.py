@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from predicu.cube import BedcountCube
+from predicu.data import BEDCOUNT_COLUMNS, compact_dtypes
+from predicu.preprocessing import preprocess_bedcounts
+from predicu.tests.utils import make_raw_bedcounts
+
+
+def test_bedcount_cube():
+    d = preprocess_bedcounts(make_raw_bedcounts())
+    cube = preprocess_bedcounts(make_raw_bedcounts(), as_cube=True)
+    assert isinstance(cube, BedcountCube)
+    assert cube.values.shape == (
+        d.date.nunique(),
+        d.icu_name.nunique(),
+        len(BEDCOUNT_COLUMNS),
+    )
+    assert cube.values.flags.c_contiguous
+
+    res = cube.to_frame().sort_values(by=["date", "icu_name"])
+    expected = d.sort_values(by=["date", "icu_name"])
+    np.testing.assert_array_equal(
+        res[BEDCOUNT_COLUMNS].values, expected[BEDCOUNT_COLUMNS].values
+    )
+    np.testing.assert_array_equal(
+        res.date.values, pd.to_datetime(expected.date).values
+    )
+
+    marne = cube.select_department("Marne")
+    assert np.shares_memory(marne.values, cube.values)
+    assert set(marne.icu_names) == set(
+        d.loc[d.department == "Marne", "icu_name"]
+    )
+
+    departments, sums = cube.sum_by_department()
+    expected = d.groupby(["date", "department"])[BEDCOUNT_COLUMNS].sum()
+    for i, department in enumerate(departments):
+        np.testing.assert_array_equal(
+            sums[:, i], expected.xs(department, level="department").values
+        )
+    regions, sums = cube.sum_by_region()
+    np.testing.assert_array_equal(sums.sum(axis=1), cube.values.sum(axis=1))
+
+
+def test_bedcount_cube_attributes():
+    raw = compact_dtypes(make_raw_bedcounts())
+    cube = preprocess_bedcounts(raw, compact=True, as_cube=True)
+    for values in [cube.icu_names, cube.departments, cube.regions]:
+        assert isinstance(values, np.ndarray)
+        assert len(values) == cube.values.shape[1]
+    with pytest.raises(ValueError, match="date_as_object"):
+        preprocess_bedcounts(raw, as_cube=True, date_as_object=True)
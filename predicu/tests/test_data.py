@@ -0,0 +1,114 @@
+import datetime
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+import predicu.data
+from predicu.data import (
+    combine_bedcounts_public,
+    dates_as_objects,
+    format_public,
+    get_department_table,
+)
+from predicu.preprocessing import preprocess_bedcounts
+from predicu.synthetic import generate_public
+from predicu.tests.utils import load_test_data
+
+
+def test_reference_tables_are_lazy():
+    code = (
+        "import predicu.data\n"
+        "assert 'DEPARTMENTS' not in vars(predicu.data)\n"
+        "assert predicu.data._france_departments.cache_info().misses == 0\n"
+        "from predicu.data import DEPARTMENTS\n"
+        "assert predicu.data._france_departments.cache_info().misses == 1\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_reference_tables():
+    table = get_department_table()
+    assert table.index.is_monotonic_increasing
+    assert predicu.data.DEPARTMENTS == set(table.department)
+    for code, department in predicu.data.CODE_TO_DEPARTMENT.items():
+        assert predicu.data.DEPARTMENT_TO_CODE[department] == code
+    assert predicu.data.CODE_TO_DEPARTMENT["22"] == "Côtes-d'Armor"
+    # arrays indexed by department code
+    positions = table.index.get_indexer(["67", "68"])
+    np.testing.assert_array_equal(
+        table.population.values[positions],
+        [
+            predicu.data.DEPARTMENT_POPULATION["Bas-Rhin"],
+            predicu.data.DEPARTMENT_POPULATION["Haut-Rhin"],
+        ],
+    )
+    fixes = predicu.data.load_department_typo_fixes()
+    assert set(fixes.values()) <= predicu.data.DEPARTMENTS
+
+
+def test_combine_bedcounts_public():
+    data = load_test_data()
+    public = data["public"]
+    bedcounts = preprocess_bedcounts(data["bedcounts"])
+    public_copy = public.copy()
+    d = combine_bedcounts_public(public, bedcounts)
+    pd.testing.assert_frame_equal(public, public_copy)
+
+    expected = (
+        bedcounts.groupby(["date", "department"])[["n_covid_occ"]]
+        .sum()
+        .reset_index()
+        .merge(
+            public.assign(
+                department=public.department_code.map(
+                    predicu.data.CODE_TO_DEPARTMENT
+                )
+            ),
+            on=["date", "department"],
+        )
+        .sort_values(by=["date", "department_code"])
+    )
+    np.testing.assert_array_equal(d.department, expected.department)
+    np.testing.assert_array_equal(d.n_covid_occ, expected.n_covid_occ)
+    np.testing.assert_array_equal(
+        d.n_icu_patients_public, expected.n_icu_patients
+    )
+    np.testing.assert_array_equal(
+        d.department_pop,
+        d.department.map(predicu.data.DEPARTMENT_POPULATION),
+    )
+
+    # several dates in one call
+    dates = d.date.unique()[[0, 3]]
+    pd.testing.assert_frame_equal(
+        combine_bedcounts_public(public, bedcounts, dates=dates),
+        d.loc[d.date.isin(dates)].reset_index(drop=True),
+    )
+    d = combine_bedcounts_public(public, bedcounts, regions=[0])
+    assert d.empty
+
+
+def test_dates_as_objects():
+    d = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2020-03-01 00:00", "2020-03-02 10:00"]),
+            "n": [1, 2],
+        }
+    )
+    converted = dates_as_objects(d, ["date"])
+    assert list(converted.date) == [
+        datetime.date(2020, 3, 1),
+        datetime.date(2020, 3, 2),
+    ]
+    pd.testing.assert_series_equal(converted.n, d.n)
+    assert d.date.dtype.kind == "M"
+
+    public = generate_public(n_days=3)
+    d = format_public(public)
+    assert d.date.dtype.kind == "M"
+    pd.testing.assert_frame_equal(
+        format_public(public, date_as_object=True),
+        dates_as_objects(d, ["date"]),
+    )
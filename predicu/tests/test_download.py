@@ -0,0 +1,26 @@
+import pandas as pd
+
+from predicu.download import read_csv_url
+from predicu.synthetic import generate_bedcounts
+from predicu.tests.utils import serve_icubam
+
+
+def test_read_csv_url():
+    bedcounts = generate_bedcounts(n_icus=5, n_days=10)
+    with serve_icubam(bedcounts) as server:
+        url = f"http://{server.icubam_host}/db/all_bedcounts?API_KEY=key"
+        d = read_csv_url(url)
+        pd.testing.assert_frame_equal(d, bedcounts, check_dtype=False)
+        # the response was compressed
+        assert server.n_bytes_sent[0] < len(bedcounts.to_csv(index=False))
+
+        # not modified, the cached response is used
+        pd.testing.assert_frame_equal(read_csv_url(url), d)
+        assert server.n_rows_sent[-1] is None
+        assert server.n_bytes_sent[-1] == 0
+
+        pd.testing.assert_frame_equal(read_csv_url(url, use_cache=False), d)
+        assert server.n_rows_sent[-1] == len(bedcounts)
+
+        server.bedcounts = bedcounts.iloc[:10]
+        assert len(read_csv_url(url)) == 10
@@ -1,4 +1,10 @@
-import icubam.predicu.data as icubam_data
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import predicu.__main__
 from predicu.tests.utils import load_test_data
 
 
@@ -12,11 +18,10 @@ def make_monkeypatch_load_bedcounts(data):
 def test_export_data(tmpdir, monkeypatch):
     cached_data = load_test_data()
     monkeypatch.setattr(
-        icubam_data,
+        predicu.__main__,
         "load_bedcounts",
         make_monkeypatch_load_bedcounts(cached_data["bedcounts"]),
     )
-    import icubam.predicu.__main__
 
     test_args = dict(
         output_dir=str(tmpdir),
@@ -25,4 +30,20 @@ def test_export_data(tmpdir, monkeypatch):
         icubam_host="localhost",
         spread_cum_jump_correction=False,
     )
-    icubam.predicu.__main__.export_data(**test_args)
+    predicu.__main__.export_data(**test_args)
+    (filename,) = os.listdir(tmpdir)
+    d = pd.read_csv(os.path.join(tmpdir, filename))
+    assert len(d) > 0
+
+    profile_output = os.path.join(tmpdir, "profile.json")
+    predicu.__main__.export_data(**test_args, profile_output=profile_output)
+    with open(profile_output) as f:
+        report = json.load(f)
+    assert report[-1]["rows_out"] == len(d)
+
+    with pytest.raises(ValueError, match="n_jobs"):
+        predicu.__main__.export_data(
+            **test_args,
+            incremental_state=os.path.join(tmpdir, "state.pickle"),
+            n_jobs=2,
+        )
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from predicu.data import load_bedcounts
+from predicu.synthetic import generate_bedcounts
+from predicu.tests.utils import serve_icubam
+
+
+def test_load_bedcounts_store(tmpdir):
+    bedcounts = generate_bedcounts(n_icus=5, n_days=10)
+    store_path = str(tmpdir / "bedcounts.csv")
+    old = bedcounts.loc[bedcounts.create_date < "2020-03-20"]
+    with serve_icubam(old) as server:
+        kwargs = dict(api_key="key", icubam_host=server.icubam_host)
+        d = load_bedcounts(store_path=store_path, **kwargs)
+        pd.testing.assert_frame_equal(d, load_bedcounts(**kwargs))
+
+        server.bedcounts = bedcounts
+        d = load_bedcounts(store_path=store_path, **kwargs)
+        expected = load_bedcounts(**kwargs)
+        pd.testing.assert_frame_equal(
+            d.sort_values(by="rowid").reset_index(drop=True),
+            expected.sort_values(by="rowid").reset_index(drop=True),
+        )
+        # only the inputs since the last stored one were sent
+        last_input = old.loc[old.create_date == old.create_date.max()]
+        n_new = len(bedcounts) - len(old) + len(last_input)
+        assert server.n_rows_sent == [len(old)] * 2 + [n_new, len(bedcounts)]
+
+        load_bedcounts(store_path=store_path, **kwargs)
+        last_date = bedcounts.create_date.max()
+        n_last = (bedcounts.create_date == last_date).sum()
+        assert server.n_rows_sent[-1] == n_last
+        assert len(pd.read_csv(store_path)) == len(bedcounts)
@@ -1,17 +1,64 @@
 import datetime
+import os
 
+import pandas as pd
 import pytest
 
-from predicu.data import load_public
+from predicu.data import compact_dtypes, format_public, load_public
+from predicu.tests.utils import serve_files
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+PAGE_PATH = os.path.join(TEST_DATA_DIR, "data_gouv_hospital_data.html")
+CSV_PATH = os.path.join(
+    TEST_DATA_DIR, "donnees-hospitalieres-covid19-2020-04-08-19h00.csv"
+)
+PAGE_URL_PATH = "/fr/datasets/donnees-hospitalieres/"
+CSV_URL_PATH = "/fr/datasets/r/63352e38-d353-4b54-bfd1-f1b3ee1cabd7"
 
 
 @pytest.mark.slow
 def test_load_public_data():
     data = load_public()
-    max_date = data.date.max()
+    max_date = data.date.max().date()
     now = datetime.datetime.now()
     if now.hour < 20:
         expected_date = (now - datetime.timedelta(days=1)).date()
     else:
         expected_date = now.date()
     assert max_date == expected_date
+
+
+def test_load_public_offline(tmpdir):
+    files = {PAGE_URL_PATH: PAGE_PATH, CSV_URL_PATH: CSV_PATH}
+    expected = format_public(
+        pd.read_csv(CSV_PATH, sep=";", dtype={"dep": str})
+    )
+    expected = expected.reset_index(drop=True)
+    with serve_files(files) as server:
+        page_url = server.url + PAGE_URL_PATH
+        d = load_public(page_url=page_url, chunksize=10)
+        pd.testing.assert_frame_equal(d, expected)
+        assert server.requested == [PAGE_URL_PATH, CSV_URL_PATH]
+
+        # the resolved URL is reused
+        d = load_public(page_url=page_url, compact=True, chunksize=10)
+        pd.testing.assert_frame_equal(d, compact_dtypes(expected))
+        assert server.requested[2:] == [CSV_URL_PATH]
+
+        # and resolved again when it expired
+        load_public(page_url=page_url, url_ttl=0)
+        assert server.requested[3:] == [PAGE_URL_PATH, CSV_URL_PATH]
+
+        # or when the CSV was replaced
+        moved_page_path = str(tmpdir / "page.html")
+        with open(PAGE_PATH) as f, open(moved_page_path, "w") as g:
+            g.write(f.read().replace(CSV_URL_PATH, CSV_URL_PATH + "-new"))
+        files[PAGE_URL_PATH] = moved_page_path
+        files[CSV_URL_PATH + "-new"] = files.pop(CSV_URL_PATH)
+        d = load_public(page_url=page_url)
+        pd.testing.assert_frame_equal(d, expected)
+        assert server.requested[5:] == [
+            CSV_URL_PATH,
+            PAGE_URL_PATH,
+            CSV_URL_PATH + "-new",
+        ]
@@ -1,8 +1,24 @@
+import subprocess
+import sys
+import threading
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
 import pytest
 
-from predicu.plot import PLOTS, generate_plots
+import predicu.plot
+from predicu.plot import (
+    DERIVED_DATA,
+    PLOTS,
+    format_dates,
+    generate_plots,
+    get_plot_data,
+    load_raw_data,
+    read_only,
+    render_plot,
+)
+from predicu.plot_registry import get_plots, read_plot_variables
 from predicu.tests.utils import load_test_data
 
 
@@ -10,3 +26,246 @@ def test_generate_plots_wrong_name():
     msg = "Unknown plot.* invalid2"
     with pytest.raises(ValueError, match=msg):
         generate_plots(plots=["invalid2"])
+    with pytest.raises(ValueError, match="n_jobs"):
+        generate_plots(plots=["lineplot_pct_occ"], n_jobs=0)
+
+
+def test_format_dates():
+    dates = pd.to_datetime(["2020-03-01", "2020-04-15"])
+    expected = ["01-03", "15-04"]
+    assert format_dates(dates.values) == expected
+    assert format_dates(pd.Series(dates)) == expected
+    # datetime.date objects, see predicu.data.dates_as_objects
+    assert format_dates([date.date() for date in dates]) == expected
+    assert format_dates(
+        np.array([date.date() for date in dates], dtype=object), "%Y-%m-%d"
+    ) == ["2020-03-01", "2020-04-15"]
+
+
+def test_plot_registry(tmpdir):
+    plots = get_plots()
+    assert list(plots) == sorted(PLOTS)
+    for name in ["barplot_inputs_per_day", "lineplot_pct_occ"]:
+        module = predicu.plot._import_plot(name)
+        assert plots[name]["data_source"] == module.data_source
+        assert plots[name]["preprocesing_args"] == getattr(
+            module, "preprocesing_args", {}
+        )
+
+    path = tmpdir / "plot.py"
+    path.write("data_source = [name for name in ['bedcounts']]\n")
+    with pytest.raises(ValueError, match="data_source must be a literal"):
+        read_plot_variables(str(path))
+    path.write("preprocesing_args = {}\n")
+    with pytest.raises(ValueError, match="data_source is missing"):
+        read_plot_variables(str(path))
+
+
+def test_cli_does_not_import_plotting_libraries():
+    code = (
+        "import sys\n"
+        "import predicu.__main__\n"
+        "import predicu.plot_registry\n"
+        "predicu.plot_registry.get_plots()\n"
+        "for name in ['matplotlib', 'seaborn', 'scipy', 'predicu.plot']:\n"
+        "    assert name not in sys.modules, name\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_load_raw_data_concurrently(monkeypatch):
+    barrier = threading.Barrier(2, timeout=10)
+    calls = []
+
+    def load_data(name, **kwargs):
+        calls.append(name)
+        # fails unless both sources are loaded at the same time
+        barrier.wait()
+        return name
+
+    monkeypatch.setattr(predicu.plot, "load_data", load_data)
+    cached_data = load_raw_data(["combined_bedcounts_public", "public"], {})
+    assert cached_data == {"bedcounts": "bedcounts", "public": "public"}
+    assert sorted(calls) == ["bedcounts", "public"]
+    # loaded sources are not loaded again
+    assert load_raw_data(["bedcounts"], cached_data) is cached_data
+    assert len(calls) == 2
+
+
+def test_generate_plots_n_jobs(tmpdir):
+    plots = ["barplot_per_dept", "lineplot_deaths_healed", "lineplot_pct_occ"]
+    data = load_test_data()
+    outputs = []
+    for n_jobs in [1, 2]:
+        output_dir = tmpdir / f"n_jobs_{n_jobs}"
+        generate_plots(
+            plots=plots,
+            matplotlib_style="default",
+            output_dir=str(output_dir),
+            cached_data=data,
+            n_jobs=n_jobs,
+        )
+        outputs.append(
+            {
+                path.name: path.read_bytes()
+                for path in Path(output_dir).iterdir()
+            }
+        )
+    assert sorted(outputs[0]) == [f"{name}.png" for name in plots]
+    assert outputs[0] == outputs[1]
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_generate_plots_errors(tmpdir, monkeypatch, n_jobs):
+    get_plot_data = predicu.plot.get_plot_data
+
+    def failing_get_plot_data(plot_name, *args, **kwargs):
+        if plot_name == "lineplot_deaths_healed":
+            raise ValueError(plot_name)
+        return get_plot_data(plot_name, *args, **kwargs)
+
+    monkeypatch.setattr(predicu.plot, "get_plot_data", failing_get_plot_data)
+    with pytest.raises(RuntimeError, match="Failed plot.*deaths_healed"):
+        generate_plots(
+            plots=["lineplot_deaths_healed", "lineplot_pct_occ"],
+            matplotlib_style="default",
+            output_dir=str(tmpdir),
+            cached_data=load_test_data(),
+            n_jobs=n_jobs,
+        )
+    # the other plots are rendered
+    assert (tmpdir / "lineplot_pct_occ.png").exists()
+
+
+def test_generate_plots_memoized_preprocessing(tmpdir, monkeypatch):
+    calls = []
+    preprocess_data = predicu.plot.preprocess_data
+
+    def counting_preprocess_data(data_source, data, **kwargs):
+        calls.append(data_source)
+        return preprocess_data(data_source, data, **kwargs)
+
+    monkeypatch.setattr(
+        predicu.plot, "preprocess_data", counting_preprocess_data
+    )
+    generate_plots(
+        plots=[
+            "barplot_inputs_per_day",
+            "barplot_per_dept",
+            "lineplot_deaths_healed",
+            "lineplot_n_icu_patients_normalised_by_dept_pop",
+            "lineplot_pct_occ",
+        ],
+        matplotlib_style="default",
+        output_dir=str(tmpdir),
+        cached_data=load_test_data(),
+    )
+    # full and partial bedcounts preprocessing, and public data
+    assert sorted(calls) == ["bedcounts", "bedcounts", "public"]
+
+
+def test_derived_data_computed_once(tmpdir, monkeypatch):
+    calls = []
+    for name, (inputs, fun) in DERIVED_DATA.items():
+
+        def counting_fun(*args, name=name, fun=fun):
+            calls.append(name)
+            return fun(*args)
+
+        monkeypatch.setitem(DERIVED_DATA, name, (inputs, counting_fun))
+    generate_plots(
+        plots=[
+            "barplot_deaths_per_dept_and_day",
+            "barplot_healed_per_dept_per_day",
+            "barplot_per_dept",
+            "lineplot_deaths_healed",
+            "lineplot_pct_occ",
+            "stackplot_cum_flow_per_dept",
+        ],
+        matplotlib_style="default",
+        output_dir=str(tmpdir),
+        cached_data=load_test_data(),
+    )
+    assert sorted(calls) == [
+        "dept_daily_diff",
+        "dept_daily_sum",
+        "dept_flow",
+        "region_daily_sum",
+    ]
+
+
+def test_derived_data():
+    data = load_test_data()
+    bedcounts = get_plot_data("lineplot_cumsum_per_dept", data)
+    region = get_plot_data("lineplot_deaths_healed", data)
+    np.testing.assert_array_equal(
+        region.date, np.sort(bedcounts.date.unique())
+    )
+    np.testing.assert_array_equal(
+        region.n_covid_deaths,
+        bedcounts.groupby("date").n_covid_deaths.sum().sort_index(),
+    )
+    diff = get_plot_data("barplot_deaths_per_dept_and_day", data)
+    for department, d in diff.groupby("department"):
+        deaths = (
+            bedcounts.loc[bedcounts.department == department]
+            .groupby("date")
+            .n_covid_deaths.sum()
+            .sort_index()
+        )
+        np.testing.assert_array_equal(d.date, deaths.index)
+        np.testing.assert_array_equal(
+            d.n_covid_deaths, deaths.diff(1).fillna(0)
+        )
+
+
+@pytest.mark.parametrize("copy_on_write", [True, False])
+def test_plots_do_not_modify_their_data(tmpdir, monkeypatch, copy_on_write):
+    if copy_on_write and not predicu.plot._copy_on_write():
+        pytest.skip("pandas copy-on-write is not enabled")
+    # without copy-on-write, the data is made read-only
+    monkeypatch.setattr(predicu.plot, "_copy_on_write", lambda: copy_on_write)
+    plots = [
+        "barplot_deaths_per_dept_and_day",
+        "barplot_per_dept",
+        "lineplot_n_icu_patients_normalised_by_dept_pop",
+        "lineplot_pct_deaths_vs_healed",
+        "lineplot_pct_occ",
+        "stackplot_cum_flow_per_dept",
+    ]
+    data = load_test_data()
+    hashes = {
+        name: pd.util.hash_pandas_object(d).sum() for name, d in data.items()
+    }
+    memo = {}
+    for name in plots:
+        plot_data = get_plot_data(name, data, memo=memo)
+        d = next(iter(memo.values()))
+        assert np.shares_memory(
+            read_only(d).iloc[:, -1].values, d.iloc[:, -1].values
+        )
+        if not copy_on_write:
+            frames = plot_data
+            if not isinstance(frames, dict):
+                frames = {name: frames}
+            assert not any(
+                block.values.flags.writeable
+                for d in frames.values()
+                for block in d._mgr.blocks
+                if isinstance(block.values, np.ndarray)
+            )
+        columns = {key: list(d.columns) for key, d in memo.items()}
+        memo_hashes = {
+            key: pd.util.hash_pandas_object(d).sum()
+            for key, d in memo.items()
+        }
+        render_plot(name, plot_data, str(tmpdir), "png", "default")
+        assert columns == {key: list(d.columns) for key, d in memo.items()}
+        assert memo_hashes == {
+            key: pd.util.hash_pandas_object(d).sum()
+            for key, d in memo.items()
+        }
+    # nor does the preprocessing modify the raw data
+    assert hashes == {
+        name: pd.util.hash_pandas_object(d).sum() for name, d in data.items()
+    }
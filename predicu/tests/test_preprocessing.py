@@ -1,8 +1,25 @@
+import datetime
+
 import numpy as np
+import pandas as pd
+import pytest
 
-from predicu.data import CUM_COLUMNS
-from predicu.preprocessing import preprocess_bedcounts
-from predicu.tests.utils import load_test_data
+from predicu.data import (
+    CUM_COLUMNS,
+    compact_dtypes,
+    dates_as_objects,
+    get_region_departments,
+)
+from predicu.preprocessing import (
+    aggregate_multiple_inputs,
+    enforce_daily_values_for_all_icus,
+    fill_in_missing_days,
+    preprocess_bedcounts,
+    preprocess_bedcounts_incremental,
+    spread_cum_jumps,
+)
+from predicu.synthetic import generate_bedcounts
+from predicu.tests.utils import load_test_data, make_raw_bedcounts
 
 
 def test_bedcounts_data_preprocessing():
@@ -14,3 +31,260 @@ def test_bedcounts_data_preprocessing():
         for col in CUM_COLUMNS:
             diffs = dg[col].diff(1).fillna(0).values
             assert np.all(diffs >= 0)
+
+
+def test_aggregate_multiple_inputs_engines():
+    d = preprocess_bedcounts(make_raw_bedcounts(), full=False)
+    expected = aggregate_multiple_inputs(d, engine="loop")
+    result = aggregate_multiple_inputs(d, engine="vectorized")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_fill_in_missing_days():
+    d = preprocess_bedcounts(make_raw_bedcounts(), full=False)
+    d = aggregate_multiple_inputs(d)
+    # remove all the inputs of one ICU during 5 days
+    gap = (
+        (d.icu_name == "ICU1")
+        & (d.datetime > "2020-03-24 12:00")
+        & (d.datetime < "2020-03-29 12:00")
+    )
+    d = d.loc[~gap]
+    filled = fill_in_missing_days(d, "3D")
+    added = filled.loc[
+        (filled.icu_name == "ICU1")
+        & (filled.datetime > "2020-03-24 12:00")
+        & (filled.datetime < "2020-03-29 12:00")
+    ]
+    assert len(filled) == len(d) + len(added) + 1
+    assert len(added) == 4
+    assert np.all(added.datetime.diff(1).iloc[1:] == pd.Timedelta("1D"))
+    for col in CUM_COLUMNS:
+        assert np.all(added[col].diff(1).iloc[1:] >= 0)
+    other_icus = filled.loc[filled.icu_name != "ICU1"]
+    assert len(other_icus) == (d.icu_name != "ICU1").sum()
+
+
+def test_enforce_daily_values_for_all_icus():
+    d = preprocess_bedcounts(make_raw_bedcounts(), full=False)
+    d = aggregate_multiple_inputs(d)
+    # ICU0 starts late and stops early
+    d = d.loc[
+        (d.icu_name != "ICU0")
+        | ((d.datetime > "2020-03-23") & (d.datetime < "2020-03-28"))
+    ]
+    daily = enforce_daily_values_for_all_icus(d)
+    dates = sorted(d.date.unique())
+    assert len(daily) == len(dates) * d.icu_name.nunique()
+    assert list(daily.date) == sorted(daily.date)
+    icu0 = daily.loc[daily.icu_name == "ICU0"].set_index("date")
+    assert np.all(icu0.loc[: dates[2], CUM_COLUMNS].values == 0)
+    last_input = d.loc[d.icu_name == "ICU0"].iloc[-1]
+    for date in dates[-3:]:
+        for col in CUM_COLUMNS:
+            assert icu0.loc[date, col] == last_input[col]
+    assert set(icu0.department) == {"Marne"}
+
+
+def test_spread_cum_jumps():
+    raw = make_raw_bedcounts()
+    # ICU2 starts late, with a large number of deaths
+    raw = raw.loc[
+        (raw.icu_name != "ICU2") | (raw.create_date > "2020-03-26")
+    ].copy()
+    raw.loc[raw.icu_name == "ICU2", "n_covid_deaths"] += 30
+    d = preprocess_bedcounts(raw, full=False)
+    icu_to_first_input_date = dict(
+        d.groupby("icu_name")[["date"]].min().itertuples(name=None)
+    )
+    d = enforce_daily_values_for_all_icus(aggregate_multiple_inputs(d))
+    spread = spread_cum_jumps(d, icu_to_first_input_date)
+    assert len(spread) == len(d)
+    icu2 = spread.loc[spread.icu_name == "ICU2"].sort_values(by="date")
+    before = d.loc[d.icu_name == "ICU2"].sort_values(by="date")
+    assert before.n_covid_deaths.iloc[3] == 0
+    assert icu2.n_covid_deaths.iloc[3] > 0
+    assert icu2.n_covid_deaths.iloc[-1] == before.n_covid_deaths.iloc[-1]
+    for icu_name, dg in spread.groupby("icu_name"):
+        for col in CUM_COLUMNS:
+            assert np.all(dg.sort_values(by="date")[col].diff(1).iloc[1:] >= 0)
+
+
+
+def test_spread_cum_jumps_missing_day():
+    # no ICU has data on 2020-03-24
+    dates = pd.date_range("2020-03-21", "2020-03-31").drop("2020-03-24")
+    d = pd.DataFrame(
+        {
+            "icu_name": np.repeat(["ICU1", "ICU2"], len(dates)),
+            "date": np.tile(dates, 2),
+            **{col: 0 for col in CUM_COLUMNS},
+        }
+    )
+    d["datetime"] = d.date
+    # transfers jump around the date they started being collected
+    jump = (d.icu_name == "ICU1") & (d.date > "2020-03-25")
+    d.loc[jump, "n_covid_transfered"] = 20
+    icu_to_first_input_date = {"ICU1": dates[0], "ICU2": dates[0]}
+    spread = spread_cum_jumps(d, icu_to_first_input_date)
+    icu1 = spread.loc[spread.icu_name == "ICU1"].set_index("date")
+    # a ramp over the days since the first date, up to 2 days after the
+    # switch point
+    expected = [3, 6, 9, 15, 18, 20, 20, 20, 20, 20]
+    np.testing.assert_array_equal(icu1.n_covid_transfered, expected)
+    assert np.all(spread.loc[spread.icu_name == "ICU2", CUM_COLUMNS] == 0)
+
+
+@pytest.mark.parametrize("spread_cum_jump_correction", [False, True])
+def test_preprocess_bedcounts_incremental(spread_cum_jump_correction):
+    raw = make_raw_bedcounts()
+    # ICU2 starts late
+    raw = raw.loc[
+        (raw.icu_name != "ICU2") | (raw.create_date > "2020-03-26")
+    ]
+    state = None
+    checkpoints = pd.date_range(
+        "2020-03-21", "2020-04-02", freq=pd.Timedelta(hours=17)
+    )
+    for checkpoint in checkpoints:
+        # inputs that were already processed are ignored
+        new_raw = raw.loc[raw.create_date <= checkpoint]
+        d, state = preprocess_bedcounts_incremental(
+            new_raw,
+            state,
+            spread_cum_jump_correction=spread_cum_jump_correction,
+        )
+        expected = preprocess_bedcounts(
+            new_raw, spread_cum_jump_correction=spread_cum_jump_correction
+        )
+        pd.testing.assert_frame_equal(
+            d.reset_index(drop=True),
+            expected.reset_index(drop=True),
+            check_dtype=False,
+        )
+    assert len(state["inputs"]) <= 5 * raw.icu_name.nunique()
+
+
+
+@pytest.mark.parametrize("with_rowid", [False, True])
+def test_preprocess_bedcounts_incremental_late_input(with_rowid):
+    raw = make_raw_bedcounts().reset_index(drop=True)
+    if with_rowid:
+        raw["rowid"] = np.arange(len(raw))
+    checkpoint = raw.create_date.iloc[60]
+    # inputs made at the checkpoint but received after it
+    late = [raw.loc[raw.icu_name != raw.icu_name.iloc[60]].iloc[-1].copy()]
+    if with_rowid:
+        # of the ICU of the checkpoint as well
+        late.append(raw.iloc[60].copy())
+    late = pd.DataFrame(late).assign(create_date=checkpoint, n_covid_occ=50)
+    if with_rowid:
+        late["rowid"] = len(raw) + np.arange(len(late))
+    _, state = preprocess_bedcounts_incremental(
+        raw.loc[raw.create_date <= checkpoint]
+    )
+    raw = pd.concat([raw, late], ignore_index=True)
+    d, state = preprocess_bedcounts_incremental(raw, state)
+    pd.testing.assert_frame_equal(
+        d.reset_index(drop=True),
+        preprocess_bedcounts(raw).reset_index(drop=True),
+        check_dtype=False,
+    )
+    # and they are not processed again
+    d2, _ = preprocess_bedcounts_incremental(raw, state)
+    pd.testing.assert_frame_equal(d2, d)
+
+def test_preprocess_bedcounts_n_jobs():
+    raw = make_raw_bedcounts(n_icus=7)
+    expected = preprocess_bedcounts(raw, spread_cum_jump_correction=True)
+    d = preprocess_bedcounts(raw, spread_cum_jump_correction=True, n_jobs=3)
+    pd.testing.assert_frame_equal(d, expected)
+    for n_jobs in [0, -2]:
+        with pytest.raises(ValueError, match="n_jobs"):
+            preprocess_bedcounts(raw, n_jobs=n_jobs)
+
+
+def test_preprocess_bedcounts_hook():
+    raw = make_raw_bedcounts()
+    report = []
+    d = preprocess_bedcounts(
+        raw, spread_cum_jump_correction=True, hook=report.append
+    )
+    pd.testing.assert_frame_equal(
+        d, preprocess_bedcounts(raw, spread_cum_jump_correction=True)
+    )
+    assert [r["stage"] for r in report] == [
+        "rename",
+        "fix_department_typos",
+        "format_data",
+        "fix_mulhouse_chir",
+        "aggregate_multiple_inputs",
+        "fill_in_missing_days",
+        "enforce_daily_values_for_all_icus",
+        "spread_cum_jumps",
+        "sort_and_filter",
+    ]
+    assert report[0]["rows_in"] == len(raw)
+    assert report[-1]["rows_out"] == len(d)
+    for r in report:
+        assert r["wall_time"] >= 0
+        assert r["peak_memory"] >= 0
+
+
+def test_preprocess_bedcounts_compact():
+    raw = load_test_data()["bedcounts"]
+    d = preprocess_bedcounts(raw)
+    compact = preprocess_bedcounts(compact_dtypes(raw), compact=True)
+    assert compact.icu_name.dtype == "category"
+    assert compact.date.dtype.kind == "M"
+    assert (
+        compact.memory_usage(deep=True).sum()
+        < d.memory_usage(deep=True).sum() / 2
+    )
+    pd.testing.assert_frame_equal(compact, compact_dtypes(d))
+    np.testing.assert_allclose(
+        compact[CUM_COLUMNS].values, d[CUM_COLUMNS].values, rtol=1e-6
+    )
+
+
+@pytest.mark.parametrize("region", ["Grand-Est", "Ile-de-France", 84])
+def test_preprocess_bedcounts_restrict_to_region(region):
+    raw = generate_bedcounts(n_icus=40, n_days=20)
+    d = preprocess_bedcounts(raw, restrict_to_region=region)
+    departments = get_region_departments(region)
+    assert len(d) > 0
+    assert set(d.department) <= set(departments)
+    # the daily grid starts at the first input of the region
+    expected = preprocess_bedcounts(raw)
+    expected = expected.loc[
+        expected.department.isin(departments)
+        & (expected.date >= d.date.min())
+    ]
+    pd.testing.assert_frame_equal(
+        d.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+    with pytest.raises(ValueError, match="Unknown region"):
+        preprocess_bedcounts(raw, restrict_to_region="Atlantis")
+
+
+def test_preprocess_bedcounts_date_as_object():
+    raw = make_raw_bedcounts()
+    d = preprocess_bedcounts(raw)
+    assert d.date.dtype.kind == "M"
+    assert d.datetime.dtype.kind == "M"
+    expected = dates_as_objects(d, ["date", "datetime"])
+    d = preprocess_bedcounts(raw, date_as_object=True)
+    assert type(d.date.iloc[0]) is datetime.date
+    pd.testing.assert_frame_equal(d, expected)
+    d, _ = preprocess_bedcounts_incremental(raw, date_as_object=True)
+    pd.testing.assert_frame_equal(
+        d.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+    d = preprocess_bedcounts(raw, full=False, date_as_object=True)
+    assert type(d.date.iloc[0]) is datetime.date
+    assert d.datetime.dtype.kind == "M"
@@ -0,0 +1,146 @@
+import os
+
+import pandas as pd
+import pytest
+
+import predicu.data
+from predicu.data import (
+    RAW_BEDCOUNTS_COLUMNS,
+    format_public,
+    get_region_departments,
+    load_data,
+)
+from predicu.preprocessing import preprocess_bedcounts
+from predicu.store import read_store, write_store
+from predicu.synthetic import generate_bedcounts, generate_public
+
+
+def test_store_round_trip(tmpdir):
+    pytest.importorskip("pyarrow")
+    d = format_public(generate_public(n_days=50))
+    path = str(tmpdir / "public")
+    write_store(path, d, "date")
+    # rows are grouped by month
+    month = pd.to_datetime(d.date).dt.month
+    pd.testing.assert_frame_equal(
+        read_store(path),
+        d.iloc[month.argsort(kind="mergesort")].reset_index(drop=True),
+        check_dtype=False,
+    )
+    mtimes = {
+        f: os.stat(os.path.join(path, f)).st_mtime_ns
+        for f in os.listdir(path)
+    }
+
+    # only the modified partition is written again
+    d.loc[d.index[-1], "n_icu_patients"] += 1
+    write_store(path, d, "date")
+    for f in os.listdir(path):
+        mtime = os.stat(os.path.join(path, f)).st_mtime_ns
+        if f in ["2020-03.arrow", "2020-04.arrow"]:
+            assert mtime == mtimes[f]
+        elif f == "2020-05.arrow":
+            assert mtime != mtimes[f]
+
+
+def test_load_data_store(tmpdir, monkeypatch):
+    pytest.importorskip("pyarrow")
+    bedcounts = generate_bedcounts(n_icus=20, n_days=40)
+    calls = []
+
+    def load_bedcounts():
+        calls.append(None)
+        return bedcounts
+
+    monkeypatch.setitem(
+        predicu.data.DATA_LOADERS, "bedcounts", load_bedcounts
+    )
+    kwargs = dict(
+        columns=RAW_BEDCOUNTS_COLUMNS,
+        min_date="2020-03-28",
+        max_date="2020-04-12",
+        regions=[1, 11],
+    )
+    expected = load_data("bedcounts", **kwargs)
+    assert list(expected.columns) == RAW_BEDCOUNTS_COLUMNS
+    assert set(expected.icu_region_id) <= {1, 11}
+    assert expected.create_date.min() >= "2020-03-28"
+    assert expected.create_date.max() < "2020-04-12"
+
+    for _ in range(2):
+        d = load_data("bedcounts", store_dir=str(tmpdir), **kwargs)
+        expected_ = expected.assign(
+            create_date=pd.to_datetime(expected.create_date)
+        )
+        pd.testing.assert_frame_equal(
+            d, expected_.reset_index(drop=True), check_dtype=False
+        )
+    # the second call read the store
+    assert len(calls) == 2
+
+    with pytest.raises(ValueError, match="no region"):
+        load_data("public", regions=[1], store_dir=str(tmpdir))
+
+
+def test_load_data_departments(tmpdir, monkeypatch):
+    pytest.importorskip("pyarrow")
+    bedcounts = generate_bedcounts(
+        n_icus=20,
+        n_days=20,
+        departments=["Bas-Rhin", "Marne", "Rhône", "Paris"],
+        typo_probability=0.5,
+    )
+    public = format_public(generate_public(n_days=20))
+    monkeypatch.setitem(
+        predicu.data.DATA_LOADERS, "bedcounts", lambda: bedcounts
+    )
+    monkeypatch.setitem(predicu.data.DATA_LOADERS, "public", lambda: public)
+    departments = get_region_departments("Grand-Est")
+    assert "Bas-Rhin" in departments
+    for data_source, column in [
+        ("bedcounts", "icu_dept"),
+        ("public", "department_code"),
+    ]:
+        expected = load_data(data_source, departments=departments)
+        assert 0 < len(expected) < len(load_data(data_source))
+        # read from the store
+        load_data(data_source, store_dir=str(tmpdir))
+        d = load_data(
+            data_source, departments=departments, store_dir=str(tmpdir)
+        )
+        assert len(d) == len(expected)
+        assert set(d[column]) == set(expected[column])
+    # typos are selected as well
+    assert "Rhone" in set(
+        load_data("bedcounts", departments=["Rhône"]).icu_dept
+    )
+
+
+@pytest.mark.parametrize("use_store", [False, True])
+def test_load_data_departments_moved_icu(tmpdir, monkeypatch, use_store):
+    if use_store:
+        pytest.importorskip("pyarrow")
+    bedcounts = generate_bedcounts(
+        n_icus=6,
+        n_days=20,
+        departments=["Bas-Rhin", "Rhône"],
+        typo_probability=0,
+    )
+    # moved to Haute-Marne by the preprocessing
+    rhone_icu = bedcounts.icu_name[bedcounts.icu_dept == "Rhône"].iloc[0]
+    bedcounts.loc[bedcounts.icu_name == rhone_icu, "icu_name"] = "St-Dizier"
+    monkeypatch.setitem(
+        predicu.data.DATA_LOADERS, "bedcounts", lambda: bedcounts
+    )
+    store_dir = str(tmpdir) if use_store else None
+    d = load_data(
+        "bedcounts",
+        departments=get_region_departments("Grand-Est"),
+        store_dir=store_dir,
+    )
+    assert set(d.icu_name[d.icu_dept != "Bas-Rhin"]) == {"St-Dizier"}
+    pd.testing.assert_frame_equal(
+        preprocess_bedcounts(d, restrict_to_region="Grand-Est"),
+        preprocess_bedcounts(bedcounts, restrict_to_region="Grand-Est"),
+        check_dtype=False,
+    )
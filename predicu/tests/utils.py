@@ -1,22 +1,187 @@
-import os
+import contextlib
+import gzip
+import hashlib
+import http.server
+import socketserver
+import threading
+import urllib.parse
 
+import numpy as np
 import pandas as pd
 
-from predicu.data import BASE_PATH
+from predicu.data import format_public
+from predicu.synthetic import generate_bedcounts, generate_public
+
+DEPARTMENTS_GRAND_EST = [
+    "Ardennes",
+    "Aube",
+    "Marne",
+    "Haute-Marne",
+    "Meurthe-et-Moselle",
+    "Meuse",
+    "Moselle",
+    "Bas-Rhin",
+    "Haut-Rhin",
+    "Vosges",
+]
 
 
 def load_test_data():
-    test_public_path = os.path.join(BASE_PATH, "tests/data/public_data.csv")
-    test_public = pd.read_csv(test_public_path, index_col=False)
-    test_public["date"] = pd.to_datetime(test_public["date"]).dt.date
-    test_bc_path = os.path.join(BASE_PATH, "tests/data/bedcounts.csv")
-    test_bc = pd.read_csv(test_bc_path, index_col=False, comment="#")
-    test_bc["create_date"] = pd.to_datetime(test_bc["create_date"]).dt.date
-    test_bc["datetime"] = pd.to_datetime(test_bc["datetime"])
-    # these should be string not int
-    test_bc["icu_name"] = test_bc["icu_name"].astype(str)
+    """Synthetic raw bedcounts and formatted public data of Grand-Est"""
+    test_bc = generate_bedcounts(
+        n_icus=30, n_days=25, departments=DEPARTMENTS_GRAND_EST
+    )
+    test_public = format_public(
+        generate_public(n_days=25, departments=DEPARTMENTS_GRAND_EST)
+    )
     cached_data = {
         "public": test_public,
         "bedcounts": test_bc,
     }
     return cached_data
+
+
+def make_raw_bedcounts(n_icus=4, n_days=12, seed=0):
+    """Random ICUBAM-like raw bedcounts, with several inputs per day,
+  duplicate inputs and decreasing cumulative values"""
+    rng = np.random.RandomState(seed)
+    rows = []
+    for icu_id in range(n_icus):
+        n_inputs = n_days * 3
+        offsets = np.sort(rng.randint(0, n_days * 24 * 60, size=n_inputs))
+        # some inputs are entered twice within a few minutes
+        duplicates = rng.choice(n_inputs, size=n_inputs // 5)
+        offsets = np.sort(np.concatenate([offsets, offsets[duplicates] + 3]))
+        cum = np.cumsum(rng.randint(0, 3, size=(len(offsets), 4)), axis=0)
+        cum -= rng.randint(0, 2, size=cum.shape) * rng.randint(0, 4)
+        for offset, cum_values in zip(offsets, cum):
+            create_date = pd.Timestamp("2020-03-20") + pd.Timedelta(
+                minutes=int(offset)
+            )
+            rows.append(
+                {
+                    "create_date": create_date,
+                    "icu_name": f"ICU{icu_id}",
+                    "icu_dept": ["Marne", "Moselle"][icu_id % 2],
+                    "icu_region_id": 1,
+                    "n_covid_deaths": cum_values[0],
+                    "n_covid_healed": cum_values[1],
+                    "n_covid_transfered": cum_values[2],
+                    "n_covid_refused": cum_values[3],
+                    "n_covid_free": rng.randint(0, 10),
+                    "n_ncovid_free": rng.randint(0, 10),
+                    "n_covid_occ": rng.randint(0, 20),
+                    "n_ncovid_occ": (
+                        np.nan if rng.rand() < 0.2 else rng.randint(0, 20)
+                    ),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+@contextlib.contextmanager
+def serve_icubam(bedcounts):
+    """Local stand-in for the ICUBAM server, serving `bedcounts`
+
+  The served data can be changed through `server.bedcounts`. Responses are
+  compressed with gzip when asked and revalidated with ETags. The number of
+  rows (None for 304 responses) and of bytes of each response are appended
+  to `server.n_rows_sent` and `server.n_bytes_sent`.
+
+  Yields:
+    the server, whose ICUBAM host is `server.icubam_host`
+  """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            if url.path != "/db/all_bedcounts" or "API_KEY" not in query:
+                self.send_error(404)
+                return
+            d = server.bedcounts
+            if "since" in query:
+                since = pd.Timestamp(query["since"][0])
+                d = d.loc[pd.to_datetime(d.create_date) >= since]
+            body = d.to_csv(index=False).encode()
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                server.n_rows_sent.append(None)
+                server.n_bytes_sent.append(0)
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            server.n_rows_sent.append(len(d))
+            self.send_response(200)
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                self.send_header("Content-Encoding", "gzip")
+            server.n_bytes_sent.append(len(body))
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    server = Server(("localhost", 0), Handler)
+    server.bedcounts = bedcounts
+    server.n_rows_sent = []
+    server.n_bytes_sent = []
+    server.icubam_host = f"localhost:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextlib.contextmanager
+def serve_files(files):
+    """Local HTTP server serving the files at the paths of `files`
+
+  `files` maps URL paths to file paths. The URL paths of the requests are
+  appended to `server.requested`.
+
+  Yields:
+    the server, whose base URL is `server.url`
+  """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = urllib.parse.urlparse(self.path).path
+            server.requested.append(path)
+            if path not in files:
+                self.send_error(404)
+                return
+            with open(files[path], "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    server = Server(("localhost", 0), Handler)
+    server.requested = []
+    server.url = f"http://localhost:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()